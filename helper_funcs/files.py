@@ -1,5 +1,6 @@
 """Functions for working with files."""
 
+import gzip
 import os
 import re
 from datetime import datetime
@@ -52,3 +53,35 @@ def find_files_with_filters_and_extensions(
         print(f"{len(filtered_files)} files found.")
 
     return filtered_files
+
+
+def write_token_file(tokenized_docs, path):
+    """
+    Write tokenized docs to a token file.
+
+    The file has one doc per line with tokens separated by spaces, which is
+    the format read by Gensim's `LineSentence` and `corpus_file` arguments.
+    The file is gzip-compressed if `path` ends with `.gz`.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    num_docs = 0
+    with opener(path, "wt", encoding="utf-8") as f:
+        for doc in tokenized_docs:
+            f.write(" ".join(doc) + "\n")
+            num_docs += 1
+    print(f"Wrote {num_docs} docs to {path}")
+    return path
+
+
+def read_token_file(path):
+    """
+    Stream the tokenized docs of a token file written by `write_token_file`.
+
+    Yields exactly one doc per line, including empty docs, so the position
+    of a doc is its line number. Unlike Gensim's `LineSentence`, long lines
+    are not split. Gzip-compressed files (`.gz`) are read transparently.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            yield line.split()
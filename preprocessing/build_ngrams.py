@@ -1,6 +1,22 @@
 """Build n-grams from a list of tokenized documents."""
 
-from gensim.models.phrases import ENGLISH_CONNECTOR_WORDS, Phrases
+import copy
+from functools import partial
+from multiprocessing import Pool
+
+from gensim import utils
+from gensim.models.phrases import (
+    ENGLISH_CONNECTOR_WORDS,
+    FrozenPhrases,
+    Phrases,
+    npmi_scorer,
+    original_scorer,
+)
+
+from helper_funcs.files import read_token_file, write_token_file
+
+# Scoring functions accepted by `Phrases`
+SCORERS = {"default": original_scorer, "npmi": npmi_scorer}
 
 
 def train_phrase_model(
@@ -28,3 +44,217 @@ def train_phrase_model(
     )
 
     return phrase_model.freeze()
+
+
+def _count_phrases_in_shard(shard, load_shard=read_token_file):
+    """Count the unigrams and bigrams of a single shard."""
+    return Phrases(load_shard(shard), connector_words=ENGLISH_CONNECTOR_WORDS)
+
+
+def merge_phrase_counts(phrase_models, merged):
+    """
+    Add the vocabulary counts of several `Phrases` models to `merged`.
+
+    Counting doesn't depend on `min_count`, `threshold` or `scoring`, so
+    the partial models can use any settings. The merge follows
+    `Phrases.add_vocab`, including pruning past `max_vocab_size`.
+    """
+    for phrase_model in phrase_models:
+        merged.corpus_word_count += phrase_model.corpus_word_count
+        merged.min_reduce = max(merged.min_reduce, phrase_model.min_reduce)
+        for word, count in phrase_model.vocab.items():
+            merged.vocab[word] = merged.vocab.get(word, 0) + count
+        if len(merged.vocab) > merged.max_vocab_size:
+            utils.prune_vocab(merged.vocab, merged.min_reduce)
+            merged.min_reduce += 1
+    return merged
+
+
+def count_phrases_in_shards(
+    shards,
+    load_shard=read_token_file,
+    n_process=1,
+    **phrases_kwargs,
+):
+    """
+    Count unigrams and bigrams over on-disk shards of tokenized docs.
+
+    Each shard is read with `load_shard`, which must return an iterable of
+    token lists. By default, shards are token files with exactly one doc
+    per line and tokens separated by spaces (see `read_token_file`). For
+    other formats (e.g., DocBin shards), pass a picklable module-level
+    function. With `n_process > 1`, every worker counts whole shards and
+    the partial counts are merged as they arrive, so only the merged
+    vocabulary and one partial count need to fit in memory.
+
+    Return an unfrozen `Phrases` model built with `phrases_kwargs` (e.g.,
+    `min_count`, `threshold`, `scoring`).
+    """
+    merged = Phrases(connector_words=ENGLISH_CONNECTOR_WORDS, **phrases_kwargs)
+    count_shard = partial(_count_phrases_in_shard, load_shard=load_shard)
+    if n_process == 1:
+        return merge_phrase_counts(map(count_shard, shards), merged)
+    with Pool(n_process) as pool:
+        return merge_phrase_counts(pool.imap_unordered(count_shard, shards), merged)
+
+
+def train_phrase_model_from_shards(
+    shards,
+    load_shard=read_token_file,
+    n_process=1,
+    min_count=5,
+    threshold=0.7,
+    scoring="npmi",
+):
+    """
+    Train a phrase model on on-disk shards of tokenized docs.
+
+    Same as `train_phrase_model`, but the docs are streamed from `shards`
+    and counted in parallel (see `count_phrases_in_shards`).
+    """
+    phrase_model = count_phrases_in_shards(
+        shards,
+        load_shard,
+        n_process,
+        min_count=min_count,
+        threshold=threshold,
+        scoring=scoring,
+    )
+    return phrase_model.freeze()
+
+
+def save_phrase_counts(phrase_model, path="phrase_counts.model"):
+    """
+    Save the raw counts of an unfrozen `Phrases` model to a file.
+
+    Frozen models for different settings can later be derived from the
+    counts with `freeze_phrase_models`, without recounting the corpus.
+    """
+    phrase_model.save(path)
+    print(f"Saved phrase counts to {path}")
+
+
+def load_phrase_counts(path="phrase_counts.model"):
+    """Load the raw counts saved with `save_phrase_counts`."""
+    return Phrases.load(path)
+
+
+def freeze_phrase_models(
+    phrase_counts,
+    min_counts=(5,),
+    thresholds=(0.7,),
+    scorings=("npmi",),
+):
+    """
+    Derive frozen phrase models for combinations of settings from counts.
+
+    Bigrams are scored once per `(min_count, scoring)` pair, since scores
+    don't depend on the threshold, and each threshold only filters the
+    scored bigrams. Return a dict mapping `(min_count, threshold, scoring)`
+    to the same `FrozenPhrases` that `train_phrase_model` would return.
+    Invalid combinations raise the same errors as `Phrases`.
+    """
+    # Reuse the validation of `Phrases` before doing any work
+    for scoring in scorings:
+        for min_count in min_counts:
+            for threshold in thresholds:
+                Phrases(min_count=min_count, threshold=threshold, scoring=scoring)
+
+    frozen_models = {}
+    for scoring in scorings:
+        for min_count in min_counts:
+            # Score every bigram by freezing a shallow copy without threshold
+            scored_model = copy.copy(phrase_counts)
+            scored_model.min_count = min_count
+            scored_model.scoring = SCORERS.get(scoring, scoring)
+            scored_model.threshold = float("-inf")
+            all_phrases = scored_model.freeze()
+
+            for threshold in thresholds:
+                frozen = copy.copy(all_phrases)
+                frozen.threshold = threshold
+                frozen.phrasegrams = {
+                    phrase: score
+                    for phrase, score in all_phrases.phrasegrams.items()
+                    if score > threshold
+                }
+                frozen_models[(min_count, threshold, scoring)] = frozen
+    return frozen_models
+
+
+# Phrase model of each worker process, set by `_init_phrase_worker`
+_worker_phrase_model = None
+
+
+def _load_phrase_model(phrase_model):
+    """Load a frozen phrase model if given its path."""
+    if isinstance(phrase_model, str):
+        return FrozenPhrases.load(phrase_model)
+    return phrase_model
+
+
+def _init_phrase_worker(phrase_model):
+    """Load the phrase model once per worker process."""
+    global _worker_phrase_model
+    _worker_phrase_model = _load_phrase_model(phrase_model)
+
+
+def _apply_phrase_model_to_doc(tokenized_doc):
+    """Apply the worker's phrase model to a tokenized doc."""
+    return _worker_phrase_model[tokenized_doc]
+
+
+def _apply_phrase_model_to_shard(
+    shard_paths, load_shard=read_token_file, phrase_model=None
+):
+    """Apply a phrase model (the worker's by default) to a shard."""
+    phrase_model = phrase_model or _worker_phrase_model
+    path_in, path_out = shard_paths
+    docs = (phrase_model[doc] for doc in load_shard(path_in))
+    return write_token_file(docs, path_out)
+
+
+def apply_phrase_model(phrase_model, tokenized_docs, n_process=1, chunksize=1000):
+    """
+    Stream tokenized docs with phrases joined by a phrase model.
+
+    `phrase_model` is a frozen phrase model or the path to a saved one.
+    With `n_process > 1`, the model is loaded once per worker and the docs
+    are sent to the workers in chunks of `chunksize`, keeping their order.
+    Calls can be chained (e.g., a trigram model over the output of a bigram
+    model).
+    """
+    if n_process == 1:
+        # Bind the model locally, since chained generators run interleaved
+        phrase_model = _load_phrase_model(phrase_model)
+        for doc in tokenized_docs:
+            yield phrase_model[doc]
+        return
+    with Pool(n_process, _init_phrase_worker, (phrase_model,)) as pool:
+        yield from pool.imap(_apply_phrase_model_to_doc, tokenized_docs, chunksize)
+
+
+def apply_phrase_model_to_shards(
+    phrase_model,
+    shards,
+    out_shards,
+    load_shard=read_token_file,
+    n_process=1,
+):
+    """
+    Apply a phrase model to on-disk shards of tokenized docs.
+
+    Each shard in `shards` is read with `load_shard` (see
+    `count_phrases_in_shards`), and the transformed docs are written to
+    the matching path in `out_shards` as a token file (gzip-compressed if
+    the path ends with `.gz`), so that line i of an output shard is doc i
+    of its input shard. Return the paths of the written shards.
+    """
+    apply_shard = partial(_apply_phrase_model_to_shard, load_shard=load_shard)
+    shard_paths = list(zip(shards, out_shards))
+    if n_process == 1:
+        phrase_model = _load_phrase_model(phrase_model)
+        apply_shard = partial(apply_shard, phrase_model=phrase_model)
+        return list(map(apply_shard, shard_paths))
+    with Pool(n_process, _init_phrase_worker, (phrase_model,)) as pool:
+        return pool.map(apply_shard, shard_paths, chunksize=1)
@@ -13,15 +13,6 @@ class TextCleaner:
 
     def __init__(self):
         """Initialize the TextCleaner class."""
-        self.normalize_text = tp.make_pipeline(  # type: ignore
-            tp.normalize.whitespace,
-            tp.normalize.bullet_points,
-            tp.normalize.hyphenated_words,  # reattach separated by line breaks
-            tp.normalize.quotation_marks,
-            tp.normalize.unicode,
-            tp.remove.accents,
-        )
-
         self.replace_from_text = tp.make_pipeline(  # type: ignore
             partial(tp.replace.urls, repl=" _URL_ "),
             partial(tp.replace.emails, repl=" _EMAIL_ "),
@@ -61,6 +52,38 @@ class TextCleaner:
         """Normalize hyphens."""
         return self.RE_HYPHENS.sub("-", text)
 
+    def normalize_text(self, text):
+        """
+        Normalize whitespace, bullets, hyphenated words, quotes and unicode.
+
+        The steps are the same as running the textacy pipeline
+        `whitespace -> bullet_points -> hyphenated_words -> quotation_marks
+        -> unicode -> accents`, but each step is preceded by a cheap
+        pre-scan that skips it when it cannot change the text. For example,
+        fancy bullets, curly quotes and accents are all non-ASCII, so
+        pure-ASCII input only pays for the whitespace step.
+        """
+        text = tp.normalize.whitespace(text)
+
+        is_ascii = text.isascii()
+        if not is_ascii:
+            text = tp.normalize.bullet_points(text)
+
+        # Reattach words separated by line breaks
+        if "-" in text:
+            text = tp.normalize.hyphenated_words(text)
+
+        # The backtick is the only ASCII char in textacy's quote table
+        if not is_ascii or "`" in text:
+            text = tp.normalize.quotation_marks(text)
+            is_ascii = text.isascii()
+
+        if not is_ascii:
+            text = tp.normalize.unicode(text)
+            text = tp.remove.accents(text)
+
+        return text
+
     def clean_html(self, text):
         """Clean HTML text."""
         text = html.unescape(text)  # convert html escape to characters
@@ -5,10 +5,34 @@ Notes:
 - Facebook's `fastText` library provides a pretrained model.
 """
 
-from langdetect import detect
+import re
+from functools import partial
+from multiprocessing import Pool
+
+from langdetect import DetectorFactory, detect
 from langdetect.lang_detect_exception import LangDetectException
 from langdetect import detect_langs
 
+# Make langdetect deterministic (it samples n-grams at random)
+DetectorFactory.seed = 0
+
+# Frequent English function words that are rare in other languages. Used to
+# settle clearly English texts without running langdetect. Short words that
+# are also common in other languages (e.g., "is", "on", "as") are left out.
+ENGLISH_STOPWORDS = frozenset(
+    {
+        "the", "of", "and", "that", "for", "with", "this", "are", "by",
+        "which", "from", "it", "we", "not", "or", "have", "has", "these",
+        "their", "its", "can", "between", "been", "were", "than", "also",
+        "such", "how", "our", "they", "but", "at", "more", "into", "other",
+        "what", "there", "should", "would",
+    }
+)  # fmt: skip
+
+# Whole words of letters, including accented letters, so that non-English
+# words count as words instead of being split into ASCII fragments
+RE_WORD = re.compile(r"[^\W\d_]+")
+
 
 def detect_language(text):
     """Return the language of the text."""
@@ -26,6 +50,66 @@ def is_english(text):
     return lang == 'en'
 
 
+def calc_english_stopword_ratio(text):
+    """
+    Return the ratio of English stopwords in `text` and its word count.
+
+    Words with non-ASCII letters are counted but never match a stopword,
+    so they lower the ratio of texts in other languages.
+    """
+    words = RE_WORD.findall(text.lower())
+    if not words:
+        return 0.0, 0
+    num_stop = sum(word in ENGLISH_STOPWORDS for word in words)
+    return num_stop / len(words), len(words)
+
+
+def detect_language_sample(text, max_chars=1000, min_ratio=0.2, min_words=20):
+    """
+    Return the language of a sample of the text.
+
+    Only the first `max_chars` characters are used. If at least
+    `min_words` words were found and the ratio of English stopwords among
+    them is at least `min_ratio`, return "en" without running langdetect.
+    """
+    if not isinstance(text, str) or text.strip() == '':
+        return None
+    sample = text[:max_chars]
+    if min_ratio is not None:
+        ratio, num_words = calc_english_stopword_ratio(sample)
+        if num_words >= min_words and ratio >= min_ratio:
+            return 'en'
+    return detect_language(sample)
+
+
+def detect_languages(
+    texts,
+    max_chars=1000,
+    min_ratio=0.2,
+    min_words=20,
+    n_process=1,
+    chunksize=100,
+):
+    """
+    Detect the language of each text in a corpus.
+
+    See `detect_language_sample` for the sampling and the stopword-ratio
+    pre-check (disabled if `min_ratio` is `None`). With `n_process > 1`, the
+    texts are distributed over a process pool in chunks of `chunksize`.
+    Return a list with the ISO language code (or `None`) of each text.
+    """
+    detect_func = partial(
+        detect_language_sample,
+        max_chars=max_chars,
+        min_ratio=min_ratio,
+        min_words=min_words,
+    )
+    if n_process == 1:
+        return [detect_func(text) for text in texts]
+    with Pool(n_process) as pool:
+        return pool.map(detect_func, texts, chunksize=chunksize)
+
+
 def detect_language_distribution(text):
     """
     Perform language detection on the text.
@@ -1,6 +1,15 @@
 """Filter tokens."""
 
-from ..vectorization.sparse_vectorization import SparseVec as sv
+from itertools import islice
+
+import numpy as np
+from spacy.attrs import ENT_TYPE, IS_ALPHA, IS_STOP, LEMMA, POS
+
+from vectorization.sparse_vectorization import SparseVec as sv
+from vectorization.sparse_vectorization import weight_tfidf
+
+# Token attributes exported by `Doc.to_array` for array-based filtering
+ARRAY_ATTRS = [IS_ALPHA, IS_STOP, LEMMA, POS, ENT_TYPE]
 
 
 class FilterTokens:
@@ -41,9 +50,14 @@ class FilterTokens:
         self.min_length = min_length
         self.max_length = max_length
 
+        # Lookup table mapping lemma hash ids to whether the lemma has a
+        # valid length and whether it is a custom stopword
+        self._lemma_table = {}
+
     def add_custom_stopwords(self, stopwords):
         """Add custom stopwords."""
         self.custom_stopwords.update(stopwords)
+        self._lemma_table.clear()
 
     def preprocess_tokens(self, doc, remove_stop=True):
         """
@@ -88,25 +102,239 @@ class FilterTokens:
         """Preprocess a spaCy Doc based on the class default arguments."""
         return self.preprocess_tokens(doc)
 
+    def compile_filters(self, steps):
+        """Compile a chain of filters into a single pass (see `FilterChain`)."""
+        return FilterChain(self, steps)
+
+    def _lookup_lemmas(self, lemma_ids, strings):
+        """
+        Look up the lemma table for an array of lemma hash ids.
+
+        Only the unique ids not seen before are resolved to strings.
+        """
+        uniq_ids, inverse = np.unique(lemma_ids, return_inverse=True)
+        for lemma_id in uniq_ids.tolist():
+            if lemma_id not in self._lemma_table:
+                lemma = strings[lemma_id] if lemma_id else ""
+                self._lemma_table[lemma_id] = (
+                    self.min_length <= len(lemma) <= self.max_length,
+                    lemma.lower() in self.custom_stopwords,
+                )
+        table = np.array(
+            [self._lemma_table[lemma_id] for lemma_id in uniq_ids.tolist()],
+            dtype=bool,
+        ).reshape(-1, 2)
+        return table[inverse, 0], table[inverse, 1]
+
+    def filter_array(
+        self,
+        arr,
+        strings,
+        preprocess=True,
+        remove_stop=True,
+        keep_pos=None,
+        drop_pos=None,
+        keep_ner=None,
+        drop_ner=None,
+    ):
+        """
+        Build a boolean mask over an array of `ARRAY_ATTRS` token attributes.
+
+        The mask combines the filters `preprocess_tokens` (if `preprocess`),
+        `keep_`/`drop_tokens_with_pos` and `keep_`/`drop_tokens_with_ner`,
+        and gives the same result as applying them one after another.
+        """
+        mask = np.ones(len(arr), dtype=bool)
+
+        if preprocess:
+            valid_len, custom_stop = self._lookup_lemmas(arr[:, 2], strings)
+            mask &= arr[:, 0].astype(bool) & valid_len
+            if remove_stop:
+                mask &= ~arr[:, 1].astype(bool) & ~custom_stop
+
+        # POS tags and NER labels are compared by their hash ids
+        if keep_pos is not None:
+            mask &= np.isin(arr[:, 3], [strings[tag] for tag in keep_pos])
+        if drop_pos is not None:
+            mask &= ~np.isin(arr[:, 3], [strings[tag] for tag in drop_pos])
+        if keep_ner is not None:
+            mask &= np.isin(arr[:, 4], [strings[label] for label in keep_ner])
+        if drop_ner is not None:
+            mask &= ~np.isin(arr[:, 4], [strings[label] for label in drop_ner])
+
+        return mask
+
+    def filter_docs(self, docs, as_ids=False, **kwargs):
+        """
+        Filter a batch of spaCy Docs in bulk.
+
+        The attributes of all Docs are exported with `Doc.to_array` and
+        filtered at once with `filter_array`, which takes the filters as
+        `kwargs`. Return a list with the lemmas of the kept tokens of each
+        Doc, or with arrays of their lemma hash ids if `as_ids`.
+        """
+        docs = list(docs)
+        if not docs:
+            return []
+
+        strings = docs[0].vocab.strings
+        arr = np.concatenate([doc.to_array(ARRAY_ATTRS) for doc in docs])
+        mask = self.filter_array(arr, strings, **kwargs)
+
+        # Count the kept tokens of each Doc to split the results back
+        doc_idx = np.repeat(np.arange(len(docs)), [len(doc) for doc in docs])
+        counts = np.bincount(doc_idx[mask], minlength=len(docs))
+        bounds = np.concatenate([[0], np.cumsum(counts)]).tolist()
+
+        kept = arr[mask, 2]
+        if as_ids:
+            return [kept[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+        # Resolve each distinct lemma id to its string only once
+        uniq_ids, inverse = np.unique(kept, return_inverse=True)
+        lemmas = np.array([strings[i] for i in uniq_ids.tolist()], dtype=object)
+        lemmas = lemmas[inverse]
+        return [
+            lemmas[start:end].tolist() for start, end in zip(bounds[:-1], bounds[1:])
+        ]
+
+
+class FilterChain:
+    """
+    Chain of `FilterTokens` filters compiled into a single pass per Doc.
+
+    The chain is declared as a list of `(method_name, arg)` steps, where
+    `method_name` is one of the filtering methods of `FilterTokens` and
+    `arg` is the argument it would be called with, e.g.:
+
+        [("preprocess_tokens", True),  # `remove_stop`
+         ("keep_tokens_with_pos", {"NOUN", "PROPN"}),
+         ("drop_tokens_with_ner", {"PERSON"})]
+
+    The chain only holds sets and flags, so it can be pickled and sent to
+    worker processes (e.g., to filter a DocBin stream with
+    `multiprocessing`).
+    """
+
+    steps_to_kwargs = {
+        "preprocess_tokens": "preprocess",
+        "keep_tokens_with_pos": "keep_pos",
+        "drop_tokens_with_pos": "drop_pos",
+        "keep_tokens_with_ner": "keep_ner",
+        "drop_tokens_with_ner": "drop_ner",
+    }
+
+    def __init__(self, filter_tokens, steps):
+        """Compile the steps into the arguments of `filter_array`."""
+        self.filter_tokens = filter_tokens
+        self.kwargs = {"preprocess": False, "remove_stop": False}
+
+        for method_name, arg in steps:
+            if method_name not in self.steps_to_kwargs:
+                raise ValueError(f"Unknown filter: {method_name}")
+            key = self.steps_to_kwargs[method_name]
+            if key == "preprocess":
+                # Removing stopwords in any step removes them from the chain
+                self.kwargs["preprocess"] = True
+                self.kwargs["remove_stop"] = self.kwargs["remove_stop"] or arg
+            elif self.kwargs.get(key) is None:
+                self.kwargs[key] = set(arg)
+            elif key.startswith("keep"):
+                # Consecutive filters must satisfy all keep conditions
+                self.kwargs[key] &= set(arg)
+            else:
+                self.kwargs[key] |= set(arg)
+
+    def keep_token(self, token):
+        """Check whether a spaCy Token passes all filters in the chain."""
+        ft = self.filter_tokens
+        kw = self.kwargs
+
+        if kw["preprocess"]:
+            lemma = token.lemma_
+            if not token.is_alpha or not ft.min_length <= len(lemma) <= ft.max_length:
+                return False
+            if kw["remove_stop"] and (
+                token.is_stop or lemma.lower() in ft.custom_stopwords
+            ):
+                return False
+
+        return (
+            ("keep_pos" not in kw or token.pos_ in kw["keep_pos"])
+            and ("drop_pos" not in kw or token.pos_ not in kw["drop_pos"])
+            and ("keep_ner" not in kw or token.ent_type_ in kw["keep_ner"])
+            and ("drop_ner" not in kw or token.ent_type_ not in kw["drop_ner"])
+        )
+
+    def __call__(self, doc):
+        """Return the tokens of a spaCy Doc that pass all filters."""
+        return [t for t in doc if self.keep_token(t)]
+
+    def pipe(self, docs, batch_size=1000, as_ids=False):
+        """
+        Stream the lemmas of the kept tokens of each Doc.
+
+        The Docs are filtered in batches with `FilterTokens.filter_docs`,
+        so `docs` can be a generator (e.g., `DocBin.get_docs`).
+        """
+        docs = iter(docs)
+        while batch := list(islice(docs, batch_size)):
+            yield from self.filter_tokens.filter_docs(
+                batch, as_ids=as_ids, **self.kwargs
+            )
+
 
 class FilterTokensWithTFIDF:
-    """Filter tokens based on their TF-IDF scores."""
+    """
+    Filter tokens based on their TF-IDF scores.
+
+    A token is kept if its TF-IDF score is above `threshold` in at least
+    one document. The TF-IDF weights match Gensim's `TfidfModel` defaults
+    (raw term frequency, `log2(N / df)`, L2 normalization), but are
+    computed on scipy CSR matrices.
+
+    `tokenized_docs` can be a streamed corpus (any re-iterable, e.g., a
+    class with `__iter__` that reads docs from disk): it is iterated twice,
+    once to build the dictionary and once to compute the scores
+    `chunksize` documents at a time. One-shot iterators (e.g., generators)
+    raise a `TypeError`, since the second pass would see no documents.
+    """
 
-    def __init__(self, tokenized_docs, threshold=0.1):
+    def __init__(self, tokenized_docs, threshold=0.1, chunksize=10000):
         """Initialize the FilterTokensWithTFIDF class."""
+        if iter(tokenized_docs) is tokenized_docs:
+            raise TypeError(
+                "`tokenized_docs` should be re-iterable, not a one-shot iterator."
+            )
         self.tokenized_docs = tokenized_docs
-        self.dictionary, self.tfidf_vecs = sv.build_tfidf_vectors(tokenized_docs)
+        self.sparse_vec = sv(tokenized_docs)
+        self.dictionary = self.sparse_vec.tk_id_map
         self.threshold = threshold
+        self.chunksize = chunksize
+        self.max_scores = self.calculate_max_tfidf_scores()
         self.tokens_to_keep = self.get_tokens_above_tfidf_score()
 
-    def get_tokens_above_tfidf_score(self):
+    def _stream_tfidf_chunks(self):
+        """Stream the TF-IDF matrix of the docs as chunks of CSR rows."""
+        idfs = self.sparse_vec.get_idfs()
+        docs = iter(self.tokenized_docs)
+        while chunk := list(islice(docs, self.chunksize)):
+            bow_mat = self.sparse_vec.build_bow_matrix(chunk)
+            yield weight_tfidf(bow_mat, idfs, dtype=np.float64)
+
+    def calculate_max_tfidf_scores(self):
+        """Return the maximum TF-IDF score of each token id across docs."""
+        max_scores = np.zeros(len(self.dictionary))
+        for mat in self._stream_tfidf_chunks():
+            chunk_max = mat.max(axis=0).toarray().ravel()
+            np.maximum(max_scores, chunk_max, out=max_scores)
+        return max_scores
+
+    def get_tokens_above_tfidf_score(self, threshold=None):
         """Return tokens above a certain TF-IDF score."""
-        tokens_to_keep = set()
-        for doc_vec in self.tfidf_vecs:
-            for token_id, score in doc_vec:
-                if score > self.threshold:
-                    tokens_to_keep.add(self.dictionary[token_id])
-        return tokens_to_keep
+        threshold = self.threshold if threshold is None else threshold
+        token_ids = np.flatnonzero(self.max_scores > threshold)
+        return {self.dictionary[token_id] for token_id in token_ids.tolist()}
 
     def filter_doc(self, tokenized_doc):
         """Filter tokens based on a list of tokens to keep."""
@@ -12,6 +12,8 @@ import psutil
 import spacy
 from spacy.tokens import Doc, DocBin
 
+from preprocessing.detect_language import detect_languages
+
 # Confirm GPU availability
 # NOTE: `prefer_gpu` has to be loaded *before* any pipelines
 print("GPU available? ", spacy.prefer_gpu())  # type: ignore
@@ -36,8 +38,15 @@ class SeriesToDocs:
         batch_size: int = 25,
         n_process: int = 1,
         mem_log: bool = False,
+        target_lang: str | None = None,
     ):
-        """Initialize spaCy pipeline and parameters."""
+        """
+        Initialize spaCy pipeline and parameters.
+
+        If `target_lang` is given (e.g., "en"), the language of each text is
+        detected before parsing, and texts in other languages are skipped.
+        Their indices are recorded in `skipped_idx`.
+        """
         self.nlp = (
             spacy.blank("en")
             if model is None
@@ -53,6 +62,8 @@ class SeriesToDocs:
         self.mem_log = mem_log
         if mem_log:
             self._setup_logging()
+        self.target_lang = target_lang
+        self.skipped_idx: list[Hashable] = []
 
     def _setup_logging(self):
         log_dir = "logs"
@@ -64,8 +75,27 @@ class SeriesToDocs:
         )
         logging.info("Memory usage log during serialization")
 
+    def _filter_language(self, series: pd.Series) -> pd.Series:
+        """
+        Drop texts not written in the target language before parsing.
+
+        The indices of the dropped texts are appended to `skipped_idx`.
+        """
+        if self.target_lang is None:
+            return series
+        langs = pd.Series(
+            detect_languages(series.tolist(), n_process=self.n_process),
+            index=series.index,
+        )
+        is_target = langs == self.target_lang
+        self.skipped_idx.extend(series.index[~is_target])
+        print(f"Skipping {(~is_target).sum()} texts not in '{self.target_lang}'")
+        return series[is_target]
+
     def _stream_docs(self, series: pd.Series) -> Generator[tuple[Hashable, Doc]]:
         """Stream Series containing text data as spaCy Doc objects."""
+        series = self._filter_language(series)
+
         # Format Series in a way that spaCy can process
         text_tuples = ((text, {"idx": idx}) for idx, text in series.items())
 
@@ -164,10 +194,17 @@ class SeriesToDocsWithAttrib(SeriesToDocs):
         batch_size=25,
         n_process=1,
         mem_log=False,
+        target_lang=None,
     ):
         """Initialize the class."""
         super().__init__(
-            model, disable_pipes, enable_pipe, batch_size, n_process, mem_log
+            model,
+            disable_pipes,
+            enable_pipe,
+            batch_size,
+            n_process,
+            mem_log,
+            target_lang,
         )
         if not Doc.has_extension("idx"):
             Doc.set_extension("idx", default=None)
@@ -178,6 +215,7 @@ class SeriesToDocsWithAttrib(SeriesToDocs):
 
         Source: <https://spacy.io/usage/processing-pipelines#processing>
         """
+        series = self._filter_language(series)
         text_tuples = ((text, {"idx": str(idx)}) for idx, text in series.items())
         for doc, context in self.nlp.pipe(
             text_tuples,
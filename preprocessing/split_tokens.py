@@ -1,6 +1,9 @@
 """Split tokens using SymSpell and spaCy."""
 
-import pkg_resources
+import gc
+from collections import OrderedDict
+from importlib.resources import files
+
 import spacy
 from symspellpy.symspellpy import SymSpell
 
@@ -9,56 +12,187 @@ class SplitTokens:
     """Class for splitting tokens."""
 
     # Dictionary shipped with symspellpy
-    path = pkg_resources.resource_filename(
-        "symspellpy", "frequency_dictionary_en_82_765.txt"
-    )
-
-    # Tell whether GPU is available
-    print("GPU available:", spacy.prefer_gpu())  # type: ignore
+    path = str(files("symspellpy") / "frequency_dictionary_en_82_765.txt")
+
+    def __init__(
+        self,
+        path_dict=path,
+        model="en_core_web_trf",
+        disable_pipes=("parser",),
+        batch_size=50,
+        n_process=1,
+        cache_size=2**16,
+        prefer_gpu=True,
+    ):
+        """
+        Initialize the SplitTokens class.
+
+        `path_dict` is either a SymSpell frequency dictionary in text format
+        or a binary snapshot written by `save_dictionary` (`.pkl`). Loading
+        a snapshot skips parsing the text dictionary and replaying the
+        corpus updates, which makes starting worker processes much cheaper.
+
+        spaCy is only used for the entity and lemma checks in
+        `fix_word_segmentation`, so a lighter `model` (e.g.,
+        `en_core_web_sm`) is usually enough. If `model` is `None`, a blank
+        English pipeline is used and tokens are checked against the
+        dictionary by their text only. `cache_size` bounds the number of
+        distinct words whose segmentation is memoized.
+        """
+        # Bounded memo of segmentation results for words already seen
+        self.cache_size = cache_size
+        self._segment_cache = OrderedDict()
 
-    def __init__(self, path_dict=path):
-        """Initialize the SplitTokens class."""
         # Set up SymSpell
         self.sym_spell = SymSpell()
-        if self.sym_spell.load_dictionary(path_dict, term_index=0, count_index=1):
-            print("Dictionary loaded.")
+        if path_dict.endswith(".pkl"):
+            self.load_dictionary(path_dict)
         else:
-            print("Dictionary failed to load.")
+            if self.sym_spell.load_dictionary(path_dict, term_index=0, count_index=1):
+                print("Dictionary loaded.")
+            else:
+                print("Dictionary failed to load.")
+            self._index_vocab()
+
+        # Tell whether GPU is available
+        # NOTE: `prefer_gpu` has to be called *before* loading the pipeline
+        if model is not None and prefer_gpu:
+            print("GPU available:", spacy.prefer_gpu())  # type: ignore
 
         # Initialize spaCy model
-        self.nlp = spacy.load("en_core_web_trf")
+        self.nlp = (
+            spacy.blank("en")
+            if model is None
+            else spacy.load(model, disable=disable_pipes or [])
+        )
+        self.batch_size = batch_size
+        self.n_process = n_process
+
+    def update_dictionary(self, texts):
+        """
+        Use text to update SymSpell dictionary.
+
+        `texts` can be a single string or an iterable of strings. Only the
+        tokenizer is run, in batches.
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+
+        for doc in self.nlp.tokenizer.pipe(texts, batch_size=self.batch_size):
+            for t in doc:
+                # Check whether t is alpha and has a reasonable length
+                if t.is_alpha and (20 > len(t.text) > 2):
+                    self.sym_spell.create_dictionary_entry(t.text, 1)
+                    self.vocab.add(t.text)
+
+        # Word counts changed, so memoized segmentations may be stale
+        self._segment_cache.clear()
+
+    def save_dictionary(self, path="symspell_dict.pkl"):
+        """
+        Save the SymSpell dictionary, including corpus updates, to a file.
+
+        The snapshot is an uncompressed pickle, which loads faster than
+        re-parsing the text dictionary.
+        """
+        self.sym_spell.save_pickle(path, compressed=False)
+        print(f"Saved SymSpell dictionary to {path}")
+
+    def load_dictionary(self, path="symspell_dict.pkl"):
+        """Load a SymSpell dictionary saved with `save_dictionary`."""
+        # Unpickling millions of small objects triggers needless GC passes
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            loaded = self.sym_spell.load_pickle(path, compressed=False)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+        if loaded:
+            print("Dictionary loaded.")
+        else:
+            print("Dictionary failed to load.")
 
-    def update_dictionary(self, text):
-        """Use text to update SymSpell dictionary."""
-        doc = self.nlp.make_doc(text)
-        for t in doc:
-            # Check whether t is alpha and has a reasonable length
-            if t.is_alpha and (20 > len(t.text) > 2):
-                self.sym_spell.create_dictionary_entry(t.text, 1)
+        self._index_vocab()
+
+    def _index_vocab(self):
+        """
+        Index the vocabulary of a freshly loaded SymSpell dictionary.
+
+        The index is kept in sync with the dictionary so lookups don't have
+        to rebuild a set from `sym_spell.words`.
+        """
+        self.vocab = set(self.sym_spell.words)
+        self._segment_cache.clear()
+
+    def in_vocab(self, token):
+        """Check whether the text or lemma of a spaCy Token is in the dictionary."""
+        return not {
+            token.lemma_.lower(),
+            token.text.lower(),
+            token.lemma_,
+            token.text,
+        }.isdisjoint(self.vocab)
+
+    def _segment_word(self, word):
+        """
+        Segment a word and check whether all segments are in the dictionary.
+
+        Results are memoized for the `cache_size` most recently used words.
+        A plain dict is used rather than `lru_cache` so the class stays
+        picklable (e.g., for `multiprocessing`).
+        """
+        cached = self._segment_cache.get(word)
+        if cached is not None:
+            self._segment_cache.move_to_end(word)
+            return cached
 
-    def segment_token(self, token, cautious=True):
-        """Segment a spaCy Token."""
         # Run word segmentation without correcting words
-        seg_token = self.sym_spell.word_segmentation(token.text, max_edit_distance=0)
+        seg_word = self.sym_spell.word_segmentation(word, max_edit_distance=0)
 
         # Are all segs in the dictionary?
         segs_in_dict = all(
-            part in self.sym_spell.words for part in seg_token.corrected_string.split()
+            part in self.vocab for part in seg_word.corrected_string.split()
         )
 
+        result = seg_word.corrected_string, segs_in_dict
+        self._segment_cache[word] = result
+        if len(self._segment_cache) > self.cache_size:
+            self._segment_cache.popitem(last=False)
+        return result
+
+    def segment_token(self, token, cautious=True):
+        """Segment a spaCy Token."""
+        seg_string, segs_in_dict = self._segment_word(token.text)
+
         # Accept segmentation?
         accept_seg = segs_in_dict or (not cautious and len(token.text) >= 20)
 
         if accept_seg:
-            return seg_token.corrected_string + token.whitespace_
+            return seg_string + token.whitespace_
         else:
             return token.text_with_ws
 
     def fix_word_segmentation(self, text, cautious=True):
         """Fix word segmentation of alpha tokens."""
         # Process text with spaCy
-        doc = self.nlp(text)
-
+        return self._fix_doc_segmentation(self.nlp(text), cautious=cautious)
+
+    def fix_word_segmentation_pipe(self, texts, cautious=True):
+        """
+        Stream texts with fixed word segmentation.
+
+        The texts are processed with `nlp.pipe`, using the class batch size
+        and number of processes.
+        """
+        for doc in self.nlp.pipe(
+            texts, batch_size=self.batch_size, n_process=self.n_process
+        ):
+            yield self._fix_doc_segmentation(doc, cautious=cautious)
+
+    def _fix_doc_segmentation(self, doc, cautious=True):
+        """Fix word segmentation of the alpha tokens of a spaCy Doc."""
         # Create list to store tokens
         lst_tokens = []
 
@@ -66,9 +200,7 @@ class SplitTokens:
             if (
                 t.is_alpha
                 and (t.ent_type == 0)  # not an entity
-                and {t.lemma_.lower(), t.text.lower(), t.lemma_, t.text}.isdisjoint(
-                    set(self.sym_spell.words.keys())
-                )
+                and not self.in_vocab(t)
             ):
                 # Segment token
                 lst_tokens.append(self.segment_token(t, cautious=cautious))
@@ -0,0 +1,41 @@
+"""Benchmark the per-document latency of `TextCleaner.normalize_text`."""
+
+import timeit
+
+from preprocessing.clean_text import TextCleaner
+from preprocessing.test.unittest_cleaning_step import TEXT, normalize_text_full
+
+# Initialize the TextCleaner class
+tc = TextCleaner()
+
+# Mix of short ASCII metadata fields and noisier, non-ASCII full texts
+DOCS = [
+    "Philosophy of Biology",
+    "An introduction to the philosophy of biology and its main debates.",
+    "Journal of Theoretical Biology, vol. 12, pp. 34-56",
+    "Smith, J. and Doe, A.",
+    TEXT,
+] * 200
+
+
+def benchmark(func, docs=DOCS, repeat=5):
+    """Return the best per-document latency of `func` in microseconds."""
+    timer = timeit.Timer(lambda: [func(doc) for doc in docs])
+    best = min(timer.repeat(repeat=repeat, number=1))
+    return best / len(docs) * 1e6
+
+
+def manual_benchmark():
+    """Compare the full pipeline with the pre-scanned normalization."""
+    assert all(tc.normalize_text(d) == normalize_text_full(d) for d in DOCS)
+
+    before = benchmark(normalize_text_full)
+    after = benchmark(tc.normalize_text)
+    print(f"""Per-document latency ({len(DOCS)} docs):
+    Full pipeline: {before:.2f} us
+    With pre-scans: {after:.2f} us
+    Speedup: {before / after:.2f}x""")
+
+
+# Manual benchmark
+manual_benchmark()
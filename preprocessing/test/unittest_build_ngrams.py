@@ -0,0 +1,78 @@
+"""Test training and applying phrase models."""
+
+import unittest
+
+from gensim.models.phrases import ENGLISH_CONNECTOR_WORDS, Phrases
+from parameterized import parameterized
+
+from preprocessing.build_ngrams import (
+    apply_phrase_model,
+    freeze_phrase_models,
+    train_phrase_model,
+)
+
+DOCS = [
+    ["new", "york", "city", "is", "big"],
+    ["i", "love", "new", "york", "city"],
+    ["new", "york", "city", "never", "sleeps"],
+    ["the", "city", "of", "new", "york"],
+] * 20
+
+# Less frequent phrases, so that different settings give different models
+RARE_DOCS = [
+    ["machine", "learning", "for", "the", "new", "york", "times"],
+    ["deep", "learning", "and", "machine", "learning"],
+    ["the", "new", "deal", "of", "the", "city"],
+    ["state", "of", "the", "art", "machine", "translation"],
+] * 3
+
+
+class TestApplyPhraseModel(unittest.TestCase):
+    """Use unittest to test applying phrase models."""
+
+    def test_chained_models(self):
+        bigram = train_phrase_model(DOCS, min_count=2, threshold=0.5)
+        trigram = train_phrase_model(
+            [bigram[doc] for doc in DOCS], min_count=2, threshold=0.5
+        )
+        expected = [trigram[bigram[doc]] for doc in DOCS]
+        self.assertNotEqual(expected, [bigram[doc] for doc in DOCS])
+
+        chained = apply_phrase_model(trigram, apply_phrase_model(bigram, DOCS))
+        self.assertEqual(list(chained), expected)
+
+
+
+class TestFreezePhraseModels(unittest.TestCase):
+    """Use unittest to compare frozen models with trained models."""
+
+    @parameterized.expand([
+        ("npmi", (-0.5, 0.0, 0.5, 0.9)),
+        ("default", (0.5, 1.0, 2.0, 10.0)),
+    ])
+    def test_matches_train_phrase_model(self, scoring, thresholds):
+        docs = DOCS + RARE_DOCS
+        counts = Phrases(docs, connector_words=ENGLISH_CONNECTOR_WORDS)
+        min_counts = (1, 3, 25)
+        frozen_models = freeze_phrase_models(
+            counts, min_counts, thresholds, scorings=(scoring,)
+        )
+        self.assertEqual(len(frozen_models), len(min_counts) * len(thresholds))
+
+        all_phrasegrams = []
+        for min_count in min_counts:
+            for threshold in thresholds:
+                frozen = frozen_models[(min_count, threshold, scoring)]
+                trained = train_phrase_model(docs, min_count, threshold, scoring)
+                self.assertEqual(frozen.phrasegrams, trained.phrasegrams)
+                self.assertEqual(
+                    [frozen[doc] for doc in docs], [trained[doc] for doc in docs]
+                )
+                all_phrasegrams.append(frozen.phrasegrams)
+
+        # The settings must actually change the models
+        self.assertGreater(len({frozenset(p) for p in all_phrasegrams}), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
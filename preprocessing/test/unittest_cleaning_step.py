@@ -1,6 +1,8 @@
 """Test the clean_text function."""
 
 import unittest
+
+import textacy.preprocessing as tp
 from parameterized import parameterized
 from preprocessing.clean_text import TextCleaner
 
@@ -18,6 +20,16 @@ info@example.com. For inquiries, call +1 (555) 123-4567.
 # Initialize the TextCleaner class
 tc = TextCleaner()
 
+# Full normalization pipeline without the pre-scans in `normalize_text`
+normalize_text_full = tp.make_pipeline(
+    tp.normalize.whitespace,
+    tp.normalize.bullet_points,
+    tp.normalize.hyphenated_words,
+    tp.normalize.quotation_marks,
+    tp.normalize.unicode,
+    tp.remove.accents,
+)
+
 
 class TestCleanText(unittest.TestCase):
     """Use unittest to test cleaning routines."""
@@ -34,6 +46,22 @@ class TestCleanText(unittest.TestCase):
         self.assertEqual(tc.normalize_text(raw_text),
                          expected_text)
 
+    @parameterized.expand([
+        ("full-text", TEXT),
+        ("ascii", "  A plain\r\n\n title   with  spaces.  "),
+        ("ascii-backtick", "The `quoted` word"),
+        ("ascii-hyphen", "philo-\nsophy of bio- logy and 2- 3"),
+        ("ascii-dash-bullet", "\n - first item\n - second item"),
+        ("bullets", "\u2022 one\n  \u25cf two"),
+        ("only-quotes", "it\u2019s \u201cfine\u201d"),
+        ("accents", "Caf\u00e9 na\u0131\u0308ve e\u0301t\u00e9"),
+        ("zero-width", "zero\u200bwidth\u00a0space"),
+        ("empty", ""),])
+    def test_normalization_matches_full_pipeline(self, name, raw_text):
+        """Check that skipping steps does not change the result."""
+        self.assertEqual(tc.normalize_text(raw_text),
+                         normalize_text_full(raw_text))
+
     def setUp(self):
         """Set up the test."""
         self.processed_text = tc.clean_text(TEXT)
@@ -0,0 +1,38 @@
+"""Test the English stopword pre-check of language detection."""
+
+import unittest
+
+from preprocessing.detect_language import (
+    calc_english_stopword_ratio,
+    detect_language_sample,
+)
+
+ENGLISH = (
+    "The results of this study show that the model can be used for the "
+    "analysis of texts, and that it is more accurate than the methods "
+    "which have been proposed in other papers."
+)
+
+
+class TestEnglishStopwordRatio(unittest.TestCase):
+    """Use unittest to test the English stopword ratio."""
+
+    def test_accented_words(self):
+        # Split on accents, "forêt" and "été" gave "for", "t" and "t"
+        self.assertEqual(calc_english_stopword_ratio("forêt été"), (0.0, 2))
+        self.assertEqual(calc_english_stopword_ratio("l'économie"), (0.0, 2))
+
+    def test_ambiguous_words(self):
+        # Common Dutch, German, French and Portuguese words
+        ratio, num_words = calc_english_stopword_ratio("is on as to be an")
+        self.assertEqual((ratio, num_words), (0.0, 6))
+
+    def test_english_shortcut(self):
+        ratio, num_words = calc_english_stopword_ratio(ENGLISH)
+        self.assertGreaterEqual(ratio, 0.2)
+        self.assertGreaterEqual(num_words, 20)
+        self.assertEqual(detect_language_sample(ENGLISH), "en")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+"""Test the token filters."""
+
+import importlib
+import random
+import unittest
+
+import spacy
+from parameterized import parameterized
+from spacy.tokens import Doc
+
+from preprocessing.filter_tokens import FilterTokens, FilterTokensWithTFIDF
+
+
+class TestImports(unittest.TestCase):
+    """Use unittest to check that the filter modules import."""
+
+    def test_import_modules(self):
+        for module in (
+            "preprocessing.filter_tokens",
+            "vectorization.sparse_vectorization",
+        ):
+            importlib.import_module(module)
+
+
+WORDS = ["Theory", "biology", "the", "and", "paper", "a", "x1", "123",
+         "Darwin", "evolution", "selection", "z" * 25, "is", "Kant", "ran"]
+POS_TAGS = ["NOUN", "PROPN", "VERB", "ADJ", "ADV", "DET", "NUM", "PUNCT"]
+
+
+def make_docs(nlp, labels, num_docs=200, seed=0):
+    """Build random Docs with explicit POS tags, lemmas and entities."""
+    rng = random.Random(seed)
+    docs = []
+    for _ in range(num_docs):
+        words = rng.choices(WORDS, k=rng.randint(0, 12))
+        ents = []
+        for _ in words:
+            # Entities are single tokens, so every tag starts one
+            label = rng.choice([None, None, *labels])
+            ents.append("O" if label is None else f"B-{label}")
+        docs.append(Doc(
+            nlp.vocab,
+            words=words,
+            pos=[rng.choice(POS_TAGS) for _ in words],
+            lemmas=[rng.choice([w, w.lower(), w[:1]]) for w in words],
+            ents=ents,
+        ))
+    return docs
+
+
+class TestFilterDocs(unittest.TestCase):
+    """Use unittest to compare array filters with chained Token filters."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ft = FilterTokens()
+        cls.nlp = spacy.blank("en")
+
+        # Custom label with a hash id that doesn't fit in a signed int64
+        custom = next(f"CUSTOM{i}" for i in range(1000)
+                      if cls.nlp.vocab.strings.add(f"CUSTOM{i}") >= 2**63)
+        cls.labels = ["PERSON", "ORG", custom]
+        cls.docs = make_docs(cls.nlp, cls.labels)
+
+    def chained_filters(self, steps):
+        """Apply the Token filters of `steps` one after another."""
+        results = []
+        for doc in self.docs:
+            tokens = list(doc)
+            for method_name, arg in steps:
+                tokens = getattr(self.ft, method_name)(tokens, arg)
+            results.append([t.lemma_ for t in tokens])
+        return results
+
+    @parameterized.expand([
+        ("preprocess", [("preprocess_tokens", True)]),
+        ("keep_stop", [("preprocess_tokens", False)]),
+        ("pos", [("preprocess_tokens", True),
+                 ("keep_tokens_with_pos", {"NOUN", "PROPN"}),
+                 ("drop_tokens_with_pos", {"PROPN"})]),
+        ("keep_ner", [("keep_tokens_with_ner", {"PERSON", "CUSTOM"})]),
+        ("drop_ner", [("preprocess_tokens", True),
+                      ("drop_tokens_with_ner", {"ORG", "CUSTOM"})]),
+        ("ner_pos", [("keep_tokens_with_ner", {"CUSTOM", "ORG"}),
+                     ("keep_tokens_with_ner", {"CUSTOM"}),
+                     ("drop_tokens_with_pos", {"VERB"})]),
+    ])
+    def test_matches_chained_filters(self, name, steps):
+        # Substitute the custom label, whose name depends on its hash
+        steps = [
+            (method_name, {self.labels[2] if a == "CUSTOM" else a for a in arg}
+             if isinstance(arg, set) else arg)
+            for method_name, arg in steps
+        ]
+        expected = self.chained_filters(steps)
+        self.assertTrue(any(expected))
+
+        chain = self.ft.compile_filters(steps)
+        self.assertEqual(self.ft.filter_docs(self.docs, **chain.kwargs), expected)
+        self.assertEqual(list(chain.pipe(self.docs, batch_size=7)), expected)
+        self.assertEqual(
+            [[t.lemma_ for t in chain(doc)] for doc in self.docs], expected
+        )
+
+
+
+class TestFilterTokensWithTFIDF(unittest.TestCase):
+    """Use unittest to test the TF-IDF filter inputs."""
+
+    def test_one_shot_iterator(self):
+        # "y" is in every doc, so its IDF and scores are zero
+        docs = [["x", "y"], ["y", "z", "z"], ["y"]]
+        with self.assertRaises(TypeError):
+            FilterTokensWithTFIDF(doc for doc in docs)
+        with self.assertRaises(TypeError):
+            FilterTokensWithTFIDF(iter(docs))
+
+        self.assertEqual(
+            FilterTokensWithTFIDF(docs, threshold=0.5).tokens_to_keep,
+            {"x", "z"},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,210 @@
+"""Concurrent embedding requests with rate limiting, retries and resuming."""
+
+import asyncio
+import os
+import random
+import time
+from contextlib import nullcontext
+
+import numpy as np
+import openai
+from openai import AsyncOpenAI
+from vectorization.embedding_cache import hash_texts
+from vectorization.openai_embedding import (
+    EMBEDDING_MODEL,
+    MAX_INPUTS_PER_REQUEST,
+    MAX_TOKENS_PER_INPUT,
+    MAX_TOKENS_PER_REQUEST,
+    batch_inputs,
+    combine_pieces,
+    split_long_inputs,
+)
+
+# Errors worth retrying: timeouts, conflicts, rate limits and server errors
+RETRY_STATUS_CODES = {408, 409, 429}
+
+
+def open_async_client(openai_client=None):
+    """
+    Return an async context that yields an async OpenAI client.
+
+    Without `openai_client`, a new client is created and closed on exit.
+    Clients keep a connection pool bound to the event loop they're used
+    in, so they can't be shared across `asyncio.run` calls.
+    """
+    if openai_client is not None:
+        return nullcontext(openai_client)
+    # Retries are handled by `embed_texts_async`
+    return AsyncOpenAI(api_key=os.getenv("OPENAI_KEY"), max_retries=0)
+
+
+def is_retryable(error):
+    """Check whether a failed request should be retried."""
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRY_STATUS_CODES or error.status_code >= 500
+    return False
+
+
+class RateLimiter:
+    """
+    Limit requests and tokens per minute with two token buckets.
+
+    Each bucket holds up to a minute's allowance and refills continuously,
+    so short bursts are allowed while the average rate stays under the
+    limits. Waiting requests are served in order.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        """Initialize the RateLimiter."""
+        self.rates = np.array([requests_per_minute, tokens_per_minute], dtype=float)
+        self.available = self.rates.copy()
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        """Add the allowance accumulated since the last update."""
+        now = time.monotonic()
+        self.available = np.minimum(
+            self.rates, self.available + self.rates * (now - self.updated) / 60
+        )
+        self.updated = now
+
+    async def acquire(self, num_tokens):
+        """Wait until a request of `num_tokens` tokens can be sent."""
+        needed = np.minimum(self.rates, [1, num_tokens])
+        async with self.lock:
+            self._refill()
+            while np.any(self.available < needed):
+                wait = np.max((needed - self.available) / self.rates) * 60
+                await asyncio.sleep(wait)
+                self._refill()
+            self.available -= needed
+
+
+async def _request_with_retries(
+    openai_client, batch, model, limiter, max_retries, base_delay, max_delay
+):
+    """Send an embeddings request, retrying with jittered backoff."""
+    num_tokens = sum(len(piece) for piece in batch)
+    for attempt in range(max_retries + 1):
+        await limiter.acquire(num_tokens)
+        try:
+            response = await openai_client.embeddings.create(input=batch, model=model)
+        except openai.OpenAIError as error:
+            if attempt == max_retries or not is_retryable(error):
+                raise
+            delay = min(max_delay, base_delay * 2**attempt)
+            await asyncio.sleep(delay * random.uniform(0.5, 1))
+            continue
+        embs = np.empty((len(batch), len(response.data[0].embedding)), np.float32)
+        for item in response.data:
+            embs[item.index] = item.embedding
+        return embs
+
+
+async def embed_texts_async(
+    texts,
+    model=EMBEDDING_MODEL,
+    cache=None,
+    max_concurrency=8,
+    requests_per_minute=3000,
+    tokens_per_minute=1_000_000,
+    max_retries=6,
+    base_delay=1.0,
+    max_delay=60.0,
+    long_inputs="truncate",
+    max_tokens=MAX_TOKENS_PER_INPUT,
+    max_inputs=MAX_INPUTS_PER_REQUEST,
+    max_request_tokens=MAX_TOKENS_PER_REQUEST,
+    openai_client=None,
+):
+    """
+    Embed texts with concurrent, rate-limited requests.
+
+    Texts are encoded and packed into batches as in
+    `create_embeddings_openai`. Up to `max_concurrency` requests are in
+    flight at once, under the request and token per-minute limits, and
+    failed requests are retried with exponential backoff and jitter.
+
+    With an `EmbeddingCache`, each text is added to the cache as soon as
+    all its pieces are embedded, and texts already cached are skipped. An
+    interrupted run resumes where it stopped when called again with the
+    same cache.
+
+    Requests are sent with `openai_client` if given (it must belong to
+    the running event loop), or else with a client opened for this call.
+
+    Returns a float32 matrix whose i-th row is the embedding of the i-th
+    text.
+    """
+    settings = {"long_inputs": long_inputs, "max_tokens": max_tokens}
+    todo = list(range(len(texts)))
+    if cache is not None:
+        keys = hash_texts(texts, model, **settings)
+        missing = np.flatnonzero(cache.lookup(keys) < 0)
+        _, first = np.unique(keys[missing], return_index=True)
+        todo = missing[np.sort(first)].tolist()
+    if not todo:
+        if cache is not None:
+            return cache.get(texts, model, **settings)[0]
+        return np.empty((0, 0), dtype=np.float32)
+
+    pieces, owners = split_long_inputs(
+        [texts[i] for i in todo], long_inputs, max_tokens
+    )
+    pending = np.bincount(owners, minlength=len(todo))
+    embs = None
+    limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def embed_batch(start, end):
+        nonlocal embs
+        async with semaphore:
+            batch_embs = await _request_with_retries(
+                openai_client,
+                pieces[start:end],
+                model,
+                limiter,
+                max_retries,
+                base_delay,
+                max_delay,
+            )
+        if embs is None:
+            embs = np.empty((len(pieces), batch_embs.shape[1]), dtype=np.float32)
+        embs[start:end] = batch_embs
+        if cache is None:
+            return
+
+        # Save the texts whose pieces are all embedded
+        batch_owners = owners[start:end]
+        np.subtract.at(pending, batch_owners, 1)
+        done = np.unique(batch_owners[pending[batch_owners] == 0])
+        if len(pieces) == len(todo):
+            done_embs = embs[done]
+        else:
+            in_done = np.isin(owners, done)
+            done_embs = combine_pieces(
+                embs[in_done],
+                [piece for piece, keep in zip(pieces, in_done) if keep],
+                np.searchsorted(done, owners[in_done]),
+                len(done),
+            )
+        cache.add(keys[[todo[i] for i in done]], done_embs)
+
+    bounds = batch_inputs(pieces, max_inputs, max_request_tokens)
+    async with open_async_client(openai_client) as openai_client:
+        await asyncio.gather(*(embed_batch(start, end) for start, end in bounds))
+
+    if cache is not None:
+        print(f"Embedded {len(todo)} new texts ({len(cache)} cached)")
+        return cache.get(texts, model, **settings)[0]
+    if len(pieces) == len(texts):
+        return embs
+    return combine_pieces(embs, pieces, owners, len(texts))
+
+
+def embed_texts_concurrently(texts, **kwargs):
+    """Run `embed_texts_async` from synchronous code."""
+    return asyncio.run(embed_texts_async(texts, **kwargs))
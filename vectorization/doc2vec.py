@@ -1,7 +1,39 @@
 """Train a doc2vec model."""
 
+import json
+import os
+import tempfile
+import time
+from functools import partial
+from itertools import islice
+from multiprocessing import Pool
+
+import numpy as np
+from gensim.models.callbacks import CallbackAny2Vec
 from gensim.models.doc2vec import Doc2Vec, TaggedDocument
 
+from helper_funcs.files import write_token_file
+
+
+def validate_docs(tokenized_docs, every=1000, corpus_file=False):
+    """
+    Yield tokenized docs while checking every `every`-th one.
+
+    Sampling keeps validation cheap, and checking while streaming doesn't
+    consume generators before training. If the docs are written to a
+    `corpus_file`, tokens must also be free of whitespace.
+    """
+    for i, doc in enumerate(tokenized_docs):
+        if i % every == 0:
+            if not (
+                isinstance(doc, (list, tuple))
+                and all(isinstance(token, str) for token in doc)
+            ):
+                raise ValueError('Each document should be a list of strings.')
+            if corpus_file and any(len(token.split()) != 1 for token in doc):
+                raise ValueError('Tokens should not be empty or contain whitespace.')
+        yield doc
+
 
 class TaggedDocumentGenerator:
     """
@@ -12,41 +44,286 @@ class TaggedDocumentGenerator:
     identifiers for each document).
     """
 
-    def __init__(self, tokenized_docs):
+    def __init__(self, tokenized_docs, validate_every=1000):
         """Initialize the TaggedDocumentGenerator."""
         self.tokenized_docs = tokenized_docs
+        self.validate_every = validate_every
 
     def __iter__(self):
         """Yield a tagged document."""
-        for i, words_list in enumerate(self.tokenized_docs):
+        docs = validate_docs(self.tokenized_docs, self.validate_every)
+        for i, words_list in enumerate(docs):
             yield TaggedDocument(words=words_list, tags=[str(i)])
 
 
+class EpochLogger(CallbackAny2Vec):
+    """
+    Log per-epoch training statistics to a JSON Lines file.
+
+    Each line records the epoch, its duration, the total elapsed time, the
+    throughput in raw corpus words per second, and the latest training
+    loss. Note that Gensim only tracks the loss for some models (it stays
+    at 0 for Doc2Vec).
+    """
+
+    def __init__(self, path='doc2vec_training.jsonl', start_epoch=0):
+        """Initialize the EpochLogger."""
+        self.path = path
+        self.epoch = start_epoch
+        self.train_start = None
+        self.epoch_start = None
+
+    def on_train_begin(self, model):
+        """Record the start time of training."""
+        self.train_start = time.time()
+
+    def on_epoch_begin(self, model):
+        """Record the start time of the epoch."""
+        self.epoch_start = time.time()
+
+    def on_epoch_end(self, model):
+        """Append the statistics of the epoch to the log file."""
+        self.epoch += 1
+        now = time.time()
+        elapsed = now - self.epoch_start
+        stats = {
+            'epoch': self.epoch,
+            'epoch_time_s': round(elapsed, 3),
+            'total_time_s': round(now - self.train_start, 3),
+            'words_per_s': round(model.corpus_total_words / elapsed, 1),
+            'loss': model.get_latest_training_loss(),
+        }
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(stats) + '\n')
+
+
+class EpochCheckpoint(CallbackAny2Vec):
+    """
+    Save the model every `every` epochs.
+
+    Each checkpoint is saved as `{prefix}_epoch{n}.model`, and
+    `{prefix}.json` points to the latest one. Use
+    `resume_doc2vec_training` to restart training from it.
+
+    The pointer also records the original training schedule (total
+    epochs and learning rates), which `Doc2Vec.train` overwrites on the
+    model when training is resumed with fewer epochs.
+    """
+
+    def __init__(self, prefix='doc2vec_checkpoint', every=1, start_epoch=0):
+        """Initialize the EpochCheckpoint."""
+        self.prefix = prefix
+        self.every = every
+        self.epoch = start_epoch
+
+    def on_train_begin(self, model):
+        """Record the training schedule, unless resuming from a checkpoint."""
+        if getattr(model, 'training_schedule', None) is None:
+            model.training_schedule = _training_schedule(model)
+
+    def on_epoch_end(self, model):
+        """Save the model if a checkpoint is due."""
+        self.epoch += 1
+        if self.epoch % self.every != 0:
+            return
+        path = f'{self.prefix}_epoch{self.epoch}.model'
+        model.save(path)
+
+        # Point to the latest checkpoint only once it has been fully saved
+        with open(f'{self.prefix}.json.tmp', 'w') as f:
+            json.dump({'path': path,
+                       'epochs_done': self.epoch,
+                       'schedule': model.training_schedule}, f)
+        os.replace(f'{self.prefix}.json.tmp', f'{self.prefix}.json')
+        print(f'Saved checkpoint to {path}')
+
+
+def _training_schedule(model):
+    """Return the number of epochs and learning rates of a model."""
+    return {'epochs': model.epochs,
+            'alpha': model.alpha,
+            'min_alpha': model.min_alpha}
+
+
+def _train_model(model, tagged_docs=None, corpus_file=None, **train_kwargs):
+    """Train a Doc2Vec model on tagged docs or on a corpus file."""
+    if corpus_file is not None:
+        model.train(corpus_file=corpus_file,
+                    total_examples=model.corpus_count,
+                    total_words=model.corpus_total_words,
+                    **train_kwargs)
+    else:
+        model.train(tagged_docs,
+                    total_examples=model.corpus_count,
+                    **train_kwargs)
+
+
 def train_doc2vec_model(tokenized_docs,
                         min_count=5,
                         seed=42,
+                        corpus_file=None,
+                        validate_every=1000,
+                        callbacks=(),
                         **keyargs):
-    """Train a doc2vec model."""
-    # Check if the input is valid
-    if not all(isinstance(doc, (list, tuple)) and
-               all(isinstance(token, str) for token in doc)
-               for doc in tokenized_docs):
-        raise ValueError('Each document should be a list of strings.')
+    """
+    Train a doc2vec model.
+
+    If `corpus_file` is given, `tokenized_docs` are streamed once into
+    that file (one doc per line, tokens separated by spaces) and the model
+    is trained from the file. Gensim then reads the file with one thread
+    per worker, free of the GIL, so training scales with `workers`. If
+    `tokenized_docs` is `None`, an existing `corpus_file` is used as is.
+    Note that in this mode documents are tagged with their line number
+    (an `int`) rather than with `str(i)`.
 
+    `callbacks` are passed to `Doc2Vec.train` (e.g., `EpochLogger` and
+    `EpochCheckpoint`).
+    """
     # Define the vec2doc model
     model = Doc2Vec(min_count=min_count,
                     seed=seed,
                     **keyargs)
 
+    if corpus_file is not None:
+        if tokenized_docs is not None:
+            docs = validate_docs(tokenized_docs, validate_every, corpus_file=True)
+            write_token_file(docs, corpus_file)
+        elif not os.path.exists(corpus_file):
+            raise FileNotFoundError(f'Corpus file not found: {corpus_file}')
+
+        # Build the vocabulary and train from the file
+        model.build_vocab(corpus_file=corpus_file)
+        _train_model(model,
+                     corpus_file=corpus_file,
+                     epochs=model.epochs,
+                     callbacks=callbacks)
+        return model
+
     # Build the tagged documents
-    tagged_docs = TaggedDocumentGenerator(tokenized_docs)
+    tagged_docs = TaggedDocumentGenerator(tokenized_docs, validate_every)
 
     # Build the vocabulary
     model.build_vocab(tagged_docs)
 
     # Train the model
-    model.train(tagged_docs,
-                total_examples=model.corpus_count,
-                epochs=model.epochs)
+    _train_model(model,
+                 tagged_docs=tagged_docs,
+                 epochs=model.epochs,
+                 callbacks=callbacks)
 
     return model
+
+
+def resume_doc2vec_training(checkpoint_prefix,
+                            tokenized_docs=None,
+                            corpus_file=None,
+                            callbacks=()):
+    """
+    Resume training from the latest checkpoint of `EpochCheckpoint`.
+
+    Pass the same `tokenized_docs` or `corpus_file` used for training. The
+    remaining epochs are trained with the learning rate continuing its
+    linear decay from where the checkpoint left off. Callbacks should be
+    created with `start_epoch` set to the number of epochs already done
+    (returned as the second value).
+    """
+    with open(f'{checkpoint_prefix}.json') as f:
+        checkpoint = json.load(f)
+    model = Doc2Vec.load(checkpoint['path'])
+    epochs_done = checkpoint['epochs_done']
+    print(f'Resuming from {checkpoint["path"]} ({epochs_done} epochs done)')
+
+    # Use the original schedule, since resumed runs overwrite it on the model
+    schedule = checkpoint.get('schedule') or _training_schedule(model)
+    model.training_schedule = schedule
+    epochs, alpha, min_alpha = (
+        schedule['epochs'], schedule['alpha'], schedule['min_alpha'])
+
+    remaining = epochs - epochs_done
+    if remaining > 0:
+        start_alpha = alpha - (alpha - min_alpha) * epochs_done / epochs
+        tagged_docs = (None if tokenized_docs is None
+                       else TaggedDocumentGenerator(tokenized_docs))
+        _train_model(model,
+                     tagged_docs=tagged_docs,
+                     corpus_file=corpus_file,
+                     epochs=remaining,
+                     start_alpha=start_alpha,
+                     end_alpha=min_alpha,
+                     callbacks=callbacks)
+    model.epochs, model.alpha, model.min_alpha = epochs, alpha, min_alpha
+
+    return model, epochs_done
+
+
+_worker_doc2vec_model = None
+
+
+def _init_doc2vec_worker(model):
+    """Load the Doc2Vec model once per worker process."""
+    global _worker_doc2vec_model
+    if isinstance(model, str):
+        # Memory-map the arrays so that workers share them read-only
+        model = Doc2Vec.load(model, mmap='r')
+    _worker_doc2vec_model = model
+
+
+def _infer_chunk(chunk, epochs=None):
+    """Infer the vectors of a chunk of tokenized docs in a worker."""
+    start, docs = chunk
+    model = _worker_doc2vec_model
+
+    # Reseed per chunk so results don't depend on the number of processes
+    model.random = np.random.RandomState(model.seed + start)
+    vecs = np.empty((len(docs), model.vector_size), dtype=np.float32)
+    for i, doc in enumerate(docs):
+        vecs[i] = model.infer_vector(doc, epochs=epochs)
+    return vecs
+
+
+def _chunk_docs(tokenized_docs, chunksize):
+    """Yield `(start, docs)` chunks of tokenized docs."""
+    docs = iter(tokenized_docs)
+    start = 0
+    while chunk := list(islice(docs, chunksize)):
+        yield start, chunk
+        start += len(chunk)
+
+
+def infer_doc2vec_vectors(model,
+                          tokenized_docs,
+                          n_process=1,
+                          chunksize=1000,
+                          epochs=None):
+    """
+    Infer the vectors of unseen tokenized docs with a trained Doc2Vec model.
+
+    Returns a dense float32 matrix whose i-th row is the vector of the i-th
+    doc. `model` is a trained model or the path to a saved one. With
+    `n_process > 1`, the docs are sent to the workers in chunks of
+    `chunksize`. A model object is first saved to a temporary directory
+    with its arrays as separate `.npy` files, which each worker then
+    memory-maps read-only instead of receiving a copy.
+    """
+    path = model if isinstance(model, str) else None
+    if path is not None:
+        model = Doc2Vec.load(path, mmap='r')
+    chunks = _chunk_docs(tokenized_docs, chunksize)
+    infer = partial(_infer_chunk, epochs=epochs)
+
+    if n_process == 1:
+        _init_doc2vec_worker(model)
+        results = list(map(infer, chunks))
+    else:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            if path is None:
+                path = os.path.join(tmp_dir, 'doc2vec.model')
+                model.save(path, sep_limit=0)
+            with Pool(n_process,
+                      initializer=_init_doc2vec_worker,
+                      initargs=(path,)) as pool:
+                results = list(pool.imap(infer, chunks))
+
+    if not results:
+        return np.empty((0, model.vector_size), dtype=np.float32)
+    return np.vstack(results)
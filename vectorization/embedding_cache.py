@@ -0,0 +1,211 @@
+"""Persistent, content-addressed cache of text embeddings."""
+
+import fcntl
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+def normalize_cache_text(text):
+    """Collapse whitespace so that trivially different texts share a key."""
+    return " ".join(text.split())
+
+
+def hash_texts(texts, model, **settings):
+    """
+    Return the 64-bit cache keys of texts embedded with `model`.
+
+    `settings` that change the embedding of a text (e.g., `long_inputs`
+    and `max_tokens`) are part of the key.
+    """
+    key_parts = [model] + [f"{name}={settings[name]}" for name in sorted(settings)]
+    prefix = "".join(f"{part}\0" for part in key_parts).encode()
+    return np.fromiter(
+        (
+            int.from_bytes(
+                hashlib.blake2b(
+                    prefix + normalize_cache_text(text).encode(), digest_size=8
+                ).digest(),
+                "little",
+            )
+            for text in texts
+        ),
+        dtype=np.uint64,
+        count=len(texts),
+    )
+
+
+class EmbeddingCache:
+    """
+    Append-only on-disk cache of embeddings keyed by model and text.
+
+    The cache is a directory with `keys.bin` (the 64-bit BLAKE2b hashes of
+    the model plus the normalized text), `vectors.bin` (the float32
+    embeddings, one row per key) and a `meta.json` file with their
+    dimension. New entries are appended to the end of both files, and the
+    vectors are memory-mapped, so opening the cache only reads the keys.
+
+    Vectors are written before keys, and the number of entries is taken
+    from the shorter file, so an interrupted write never exposes a key
+    without its vector. Appends only cost as much as the new entries: their
+    keys are merged into the sorted index in memory instead of re-reading
+    the keys file.
+
+    Several processes can share a cache: appends hold an exclusive lock on
+    the directory and first pick up the entries written by others.
+    """
+
+    def __init__(self, path, dim=None):
+        """Open the cache at `path`, creating it if needed."""
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.dim = json.load(f)["dim"]
+        else:
+            self.dim = dim
+            if dim is not None:
+                self._write_meta()
+        self._load()
+
+    def _write_meta(self):
+        """Write the dimension of the vectors."""
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump({"dim": self.dim}, f)
+
+    def _file_path(self, name):
+        """Return the path of one of the cache files."""
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _load(self):
+        """Read and sort the keys, and memory-map the vectors."""
+        self.num_entries = 0 if self.dim is None else self._disk_entries()
+        keys = np.empty(0, dtype=np.uint64)
+        if self.num_entries > 0:
+            keys = np.fromfile(
+                self._file_path("keys"), dtype=np.uint64, count=self.num_entries
+            )
+        self._order = np.argsort(keys, kind="stable")
+        self._sorted_keys = keys[self._order]
+        self._map_vectors()
+
+    def _merge_keys(self, keys):
+        """Merge the keys of new entries into the sorted index."""
+        new_order = np.argsort(keys, kind="stable")
+        new_sorted_keys = keys[new_order]
+        pos = np.searchsorted(self._sorted_keys, new_sorted_keys, side="right")
+        self._sorted_keys = np.insert(self._sorted_keys, pos, new_sorted_keys)
+        self._order = np.insert(self._order, pos, new_order + self.num_entries)
+        self.num_entries += len(keys)
+
+    def _disk_entries(self):
+        """Return the number of complete entries on disk."""
+        keys_path = self._file_path("keys")
+        if not os.path.exists(keys_path):
+            return 0
+        return min(
+            os.path.getsize(keys_path) // 8,
+            os.path.getsize(self._file_path("vectors")) // (4 * self.dim),
+        )
+
+    def _refresh(self):
+        """Index the entries appended by other processes since loading."""
+        num_entries = self._disk_entries()
+        if num_entries > self.num_entries:
+            keys = np.fromfile(
+                self._file_path("keys"),
+                dtype=np.uint64,
+                count=num_entries - self.num_entries,
+                offset=8 * self.num_entries,
+            )
+            self._merge_keys(keys)
+
+    def _map_vectors(self):
+        """Memory-map the vectors of the current entries."""
+        # Empty files can't be memory-mapped
+        if self.num_entries == 0:
+            self.vectors = np.empty((0, self.dim or 0), dtype=np.float32)
+        else:
+            self.vectors = np.memmap(
+                self._file_path("vectors"),
+                dtype=np.float32,
+                mode="r",
+                shape=(self.num_entries, self.dim),
+            )
+
+    def __len__(self):
+        """Return the number of cached embeddings."""
+        return self.num_entries
+
+    def lookup(self, keys):
+        """Return the row of each key in `vectors`, or -1 if it's missing."""
+        if len(self._sorted_keys) == 0:
+            return np.full(len(keys), -1, dtype=np.int64)
+        pos = np.searchsorted(self._sorted_keys, keys)
+        pos = np.minimum(pos, len(self._sorted_keys) - 1)
+        found = self._sorted_keys[pos] == keys
+        return np.where(found, self._order[pos], -1)
+
+    def add(self, keys, vectors):
+        """Append embeddings with their keys."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            self._write_meta()
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(
+                f"Dimension {vectors.shape[1]} doesn't match the cache ({self.dim})"
+            )
+
+        keys = np.asarray(keys, dtype=np.uint64)
+        with open(os.path.join(self.path, "lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._refresh()
+
+            # Truncate leftovers of an interrupted write before appending
+            for name, itemsize in (("vectors", 4 * self.dim), ("keys", 8)):
+                file_path = self._file_path(name)
+                if os.path.exists(file_path):
+                    os.truncate(file_path, len(self) * itemsize)
+            with open(self._file_path("vectors"), "ab") as f:
+                vectors.tofile(f)
+            with open(self._file_path("keys"), "ab") as f:
+                keys.tofile(f)
+        self._merge_keys(keys)
+        self._map_vectors()
+
+    def get(self, texts, model, **settings):
+        """
+        Look up the embeddings of texts in bulk.
+
+        Returns a float32 matrix with a row per text (zeros for texts that
+        aren't cached) and a boolean mask of the texts that were found.
+        """
+        rows = self.lookup(hash_texts(texts, model, **settings))
+        found = rows >= 0
+        embs = np.zeros((len(texts), self.dim or 0), dtype=np.float32)
+        embs[found] = self.vectors[rows[found]]
+        return embs, found
+
+    def embed(self, texts, model, embed_func, **settings):
+        """
+        Return the embeddings of texts, computing only the missing ones.
+
+        `embed_func` takes a list of texts and returns their embeddings as
+        a matrix (e.g., `create_embeddings_openai`). Each distinct missing
+        text is embedded once and added to the cache. `settings` are part
+        of the keys (see `hash_texts`).
+        """
+        keys = hash_texts(texts, model, **settings)
+        rows = self.lookup(keys)
+        missing = np.flatnonzero(rows < 0)
+        if len(missing) > 0:
+            new_keys, first = np.unique(keys[missing], return_index=True)
+            new_vecs = embed_func([texts[i] for i in missing[first]])
+            self.add(new_keys, new_vecs)
+            print(f"Embedded {len(new_keys)} new texts ({len(self)} cached)")
+            rows = self.lookup(keys)
+        return np.asarray(self.vectors[rows])
@@ -1,38 +1,170 @@
 """Routines for interacting with OpenAI's ADA2 embeddings."""
 
 import os
+from functools import lru_cache, partial
+
+import numpy as np
+import pandas as pd
 from openai import OpenAI
 import tiktoken
-from helper_funcs.vectors import cosine_similarity
-
-client = OpenAI(
-    api_key=os.getenv("OPENAI_KEY")
-)
+from vectorization.semantic_search import EmbeddingMatrix
 
 EMBEDDING_MODEL = 'text-embedding-ada-002'
 EMBEDDING_CODING = 'cl100k_base'
 
+# Limits of the embeddings endpoint
+MAX_TOKENS_PER_INPUT = 8191
+MAX_INPUTS_PER_REQUEST = 2048
+MAX_TOKENS_PER_REQUEST = 300_000
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    """Get the (cached) OpenAI client, created on first use."""
+    return OpenAI(
+        api_key=os.getenv("OPENAI_KEY")
+    )
+
+
+@lru_cache(maxsize=None)
+def get_encoder(encoding=EMBEDDING_CODING):
+    """Get the (cached) tiktoken encoder."""
+    return tiktoken.get_encoding(encoding)
+
 
 def calc_num_tokens(string):
     """Calculate the number of tokens."""
-    enc = tiktoken.get_encoding(EMBEDDING_CODING)
-    num_tokens = len(enc.encode(string))
+    enc = get_encoder()
+    num_tokens = len(enc.encode_ordinary(string))
     return num_tokens
 
 
 def create_embedding_openai(text, model=EMBEDDING_MODEL):
     """Create text embedding using OpenAI's ADA2 model."""
     text = text.replace("\n", " ")
-    response = client.embeddings.create(
+    response = get_client().embeddings.create(
         input=[text],
         model=model)
     return response.data[0].embedding
 
 
+def split_long_inputs(texts, long_inputs="truncate",
+                      max_tokens=MAX_TOKENS_PER_INPUT):
+    """
+    Encode texts and handle those over the token limit of the model.
+
+    With `long_inputs="truncate"`, long texts are cut at `max_tokens`. With
+    `long_inputs="split"`, they are split into pieces of at most
+    `max_tokens`. Returns the token lists of the pieces and the index of
+    the text each piece comes from.
+    """
+    if long_inputs not in ("truncate", "split"):
+        raise ValueError('`long_inputs` should be "truncate" or "split".')
+    enc = get_encoder()
+    pieces = []
+    owners = []
+    for i, text in enumerate(texts):
+        # Special-token strings (e.g., "<|endoftext|>") are encoded as text
+        text = text.replace("\n", " ")
+        tokens = enc.encode_ordinary(text) or enc.encode_ordinary(" ")
+        if long_inputs == "truncate":
+            tokens = tokens[:max_tokens]
+        for start in range(0, len(tokens), max_tokens):
+            pieces.append(tokens[start:start + max_tokens])
+            owners.append(i)
+    return pieces, np.array(owners, dtype=np.int64)
+
+
+def batch_inputs(pieces, max_inputs=MAX_INPUTS_PER_REQUEST,
+                 max_request_tokens=MAX_TOKENS_PER_REQUEST):
+    """Yield `(start, end)` bounds of batches within the request limits."""
+    start = 0
+    num_tokens = 0
+    for end, piece in enumerate(pieces):
+        if end > start and (end - start == max_inputs
+                            or num_tokens + len(piece) > max_request_tokens):
+            yield start, end
+            start = end
+            num_tokens = 0
+        num_tokens += len(piece)
+    if start < len(pieces):
+        yield start, len(pieces)
+
+
+def create_embeddings_openai(texts, model=EMBEDDING_MODEL,
+                             long_inputs="truncate",
+                             max_tokens=MAX_TOKENS_PER_INPUT,
+                             max_inputs=MAX_INPUTS_PER_REQUEST,
+                             max_request_tokens=MAX_TOKENS_PER_REQUEST,
+                             openai_client=None,
+                             cache=None):
+    """
+    Create the embeddings of many texts with batched requests.
+
+    Texts are encoded once with a shared encoder and sent as token lists,
+    packed into as few requests as the input and token limits allow. Texts
+    over `max_tokens` are truncated or split (see `split_long_inputs`); the
+    embedding of a split text is the token-weighted average of the
+    embeddings of its pieces, normalized to unit length.
+
+    With an `EmbeddingCache`, only texts missing from the cache are sent,
+    and their embeddings are added to it.
+
+    Returns a float32 matrix whose i-th row is the embedding of the i-th
+    text.
+    """
+    if cache is not None:
+        embed_func = partial(create_embeddings_openai, model=model,
+                             long_inputs=long_inputs,
+                             max_tokens=max_tokens,
+                             max_inputs=max_inputs,
+                             max_request_tokens=max_request_tokens,
+                             openai_client=openai_client)
+        return cache.embed(texts, model, embed_func,
+                           long_inputs=long_inputs, max_tokens=max_tokens)
+
+    openai_client = openai_client or get_client()
+    pieces, owners = split_long_inputs(texts, long_inputs, max_tokens)
+    if not pieces:
+        return np.empty((0, 0), dtype=np.float32)
+
+    embs = None
+    for start, end in batch_inputs(pieces, max_inputs, max_request_tokens):
+        response = openai_client.embeddings.create(
+            input=pieces[start:end],
+            model=model)
+        if embs is None:
+            dim = len(response.data[0].embedding)
+            embs = np.empty((len(pieces), dim), dtype=np.float32)
+        for item in response.data:
+            embs[start + item.index] = item.embedding
+
+    if len(pieces) == len(texts):
+        return embs
+    return combine_pieces(embs, pieces, owners, len(texts))
+
+
+def combine_pieces(embs, pieces, owners, num_texts):
+    """Average the embeddings of the pieces of split texts by length."""
+    weights = np.array([len(piece) for piece in pieces], dtype=np.float32)
+    combined = np.zeros((num_texts, embs.shape[1]), dtype=np.float32)
+    np.add.at(combined, owners, embs * weights[:, None])
+    combined /= np.linalg.norm(combined, axis=1, keepdims=True)
+    return combined
+
+
 def query_with_openai_embedding(query, ser_embs,
-                                model=EMBEDDING_MODEL):
-    """Query with OpenAI's ADA2 model."""
+                                model=EMBEDDING_MODEL, k=None):
+    """
+    Query with OpenAI's ADA2 model.
+
+    `ser_embs` is a Series of embeddings indexed by id or, to avoid
+    rebuilding the matrix on every query, an `EmbeddingMatrix`. Returns the
+    cosine similarities of the top `k` embeddings (all by default) as a
+    Series sorted in descending order.
+    """
     query_emb = create_embedding_openai(query, model=model)
-    scores = ser_embs.apply(lambda x:
-                            cosine_similarity(x, query_emb))
-    return scores.sort_values(ascending=False)
+    if not isinstance(ser_embs, EmbeddingMatrix):
+        ser_embs = EmbeddingMatrix.from_series(ser_embs)
+    ids, scores = ser_embs.query(query_emb, k=k or len(ser_embs))
+    return pd.Series(scores, index=ids)
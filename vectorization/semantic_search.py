@@ -0,0 +1,88 @@
+"""Exact top-k semantic search over a matrix of embeddings."""
+
+import os
+
+import numpy as np
+
+
+def normalize_rows(mat):
+    """Return a contiguous float32 copy of `mat` with unit-length rows."""
+    mat = np.array(mat, dtype=np.float32, order="C", ndmin=2)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    # Zero vectors stay zero, giving a similarity of 0 like `cosine_similarity`
+    norms[norms == 0] = 1
+    mat /= norms
+    return mat
+
+
+def top_k(scores, k):
+    """Return the indices of the `k` highest scores of each row, sorted."""
+    k = min(k, scores.shape[-1])
+    if k < scores.shape[-1]:
+        top = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    else:
+        top = np.broadcast_to(np.arange(k), scores.shape)
+    top_scores = np.take_along_axis(scores, top, axis=-1)
+    order = np.argsort(-top_scores, axis=-1, kind="stable")
+    return np.take_along_axis(top, order, axis=-1)
+
+
+class EmbeddingMatrix:
+    """
+    Corpus embeddings as a normalized float32 matrix with an id per row.
+
+    Rows are normalized once, so cosine similarities are plain dot
+    products: a query takes one matrix-vector product and an
+    `argpartition` for its top k, and a batch of queries takes a single
+    matrix multiply. Saved matrices can be memory-mapped.
+    """
+
+    def __init__(self, vectors, ids=None, normalized=False):
+        """Initialize the EmbeddingMatrix."""
+        self.vectors = vectors if normalized else normalize_rows(vectors)
+        self.ids = np.arange(len(self.vectors)) if ids is None else np.asarray(ids)
+
+    @classmethod
+    def from_series(cls, ser_embs):
+        """Build the matrix from a Series of embeddings indexed by id."""
+        return cls(np.stack(ser_embs.to_numpy()), ids=ser_embs.index.to_numpy())
+
+    def __len__(self):
+        """Return the number of embeddings."""
+        return len(self.vectors)
+
+    def save(self, path):
+        """Save the vectors and ids as `.npy` files in the directory `path`."""
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "vectors.npy"), self.vectors)
+        np.save(os.path.join(path, "ids.npy"), self.ids, allow_pickle=True)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """Load a saved matrix, memory-mapping the vectors by default."""
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mmap_mode)
+        ids = np.load(os.path.join(path, "ids.npy"), allow_pickle=True)
+        return cls(vectors, ids=ids, normalized=True)
+
+    def query(self, query_vecs, k=10, batch_size=256):
+        """
+        Return the ids and cosine similarities of the top-k neighbors.
+
+        `query_vecs` is a single vector or a matrix with one query per row.
+        For a matrix, the results are `(n_queries, k)` arrays, and queries
+        are multiplied against the corpus `batch_size` at a time to bound
+        the memory of the score matrix.
+        """
+        queries = normalize_rows(query_vecs)
+        top_rows = []
+        top_scores = []
+        for start in range(0, len(queries), batch_size):
+            scores = queries[start : start + batch_size] @ self.vectors.T
+            top = top_k(scores, k)
+            top_rows.append(top)
+            top_scores.append(np.take_along_axis(scores, top, axis=1))
+        rows = np.vstack(top_rows)
+        scores = np.vstack(top_scores)
+        if np.ndim(query_vecs) == 1:
+            return self.ids[rows[0]], scores[0]
+        return self.ids[rows], scores
@@ -1,14 +1,266 @@
 """Transform text into sparse vectors using Gensim."""
 
+import json
+import os
+import zlib
+from array import array
+from collections import Counter
+from functools import partial
+from itertools import chain, islice
+from multiprocessing import Pool
+
+import numpy as np
 from gensim.corpora import Dictionary, MmCorpus
+from gensim.matutils import Sparse2Corpus
 from gensim.models import TfidfModel
+from gensim.models.tfidfmodel import df2idf
+from scipy.sparse import csr_matrix, issparse, vstack
+
+from helper_funcs.files import read_token_file
+
+
+def bow_to_csr(bow_vecs, num_terms, dtype=np.float32):
+    """
+    Stream sparse vectors into a CSR matrix with one row per document.
+
+    `bow_vecs` is an iterable of lists of `(token_id, weight)` tuples. The
+    ids and weights are appended to typed arrays as they arrive, so the
+    list-of-tuples representation is never held in memory. If `num_terms`
+    is `None`, it is inferred from the largest token id.
+    """
+    indptr = array("q", [0])
+    indices = array("i")
+    data = array(np.dtype(dtype).char)
+    for vec in bow_vecs:
+        if vec:
+            ids, weights = zip(*vec)
+            indices.extend(ids)
+            data.extend(weights)
+        indptr.append(len(indices))
+    indices = np.frombuffer(indices, dtype=np.int32)
+    if num_terms is None:
+        num_terms = int(indices.max()) + 1 if len(indices) else 0
+    return csr_matrix(
+        (
+            np.frombuffer(data, dtype=dtype),
+            indices,
+            np.frombuffer(indptr, dtype=np.int64),
+        ),
+        shape=(len(indptr) - 1, num_terms),
+    )
+
+
+def weight_tfidf(bow_mat, idfs, dtype=np.float32):
+    """
+    Weight a CSR matrix of term counts by TF-IDF.
+
+    The counts are multiplied by `idfs` (one value per term) and each row
+    is L2-normalized, like Gensim's `TfidfModel` defaults.
+    """
+    mat = bow_mat.astype(np.float64)
+    mat.data *= idfs[mat.indices]
+    norms = np.sqrt(mat.multiply(mat).sum(axis=1)).A.ravel()
+    norms[norms == 0] = 1
+    mat.data /= np.repeat(norms, np.diff(mat.indptr))
+    mat.eliminate_zeros()
+    return mat.astype(dtype)
+
+
+def as_gensim_corpus(mat):
+    """
+    Wrap a CSR matrix (one row per document) as a Gensim corpus.
+
+    Iterating over the result yields lists of `(token_id, weight)` tuples.
+    """
+    return Sparse2Corpus(mat, documents_columns=False)
+
+
+class BinaryCorpus:
+    """
+    Sparse corpus stored as binary CSR arrays.
+
+    The corpus is a directory with the raw `indptr`, `indices` and `data`
+    arrays of a CSR matrix (one row per document) and a `meta.json` file
+    with their shape and dtypes. With `mmap_mode="r"`, the arrays are
+    memory-mapped instead of read, so opening a corpus is instant
+    regardless of its size.
+
+    Rows can be accessed at random (`corpus[i]`), and iterating yields
+    lists of `(token_id, weight)` tuples, like any Gensim corpus.
+    """
+
+    def __init__(self, path, mmap_mode="r", chunksize=10000):
+        """Open a corpus written by `save_binary_corpus`."""
+        self.path = path
+        self.chunksize = chunksize
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.indptr = self._load_array("indptr", mmap_mode)
+        self.indices = self._load_array("indices", mmap_mode)
+        self.data = self._load_array("data", mmap_mode)
+
+    def _load_array(self, name, mmap_mode):
+        """Load or memory-map one of the CSR arrays."""
+        file_path = os.path.join(self.path, f"{name}.bin")
+        dtype = self.meta["dtypes"][name]
+        # Empty files can't be memory-mapped
+        if mmap_mode is None or os.path.getsize(file_path) == 0:
+            return np.fromfile(file_path, dtype=dtype)
+        return np.memmap(file_path, dtype=dtype, mode=mmap_mode)
+
+    def __len__(self):
+        """Return the number of documents."""
+        return self.meta["num_docs"]
+
+    def __getitem__(self, doc_id):
+        """Return a document as a list of `(token_id, weight)` tuples."""
+        start, end = self.indptr[doc_id], self.indptr[doc_id + 1]
+        return list(
+            zip(self.indices[start:end].tolist(), self.data[start:end].tolist())
+        )
+
+    def __iter__(self):
+        """Yield the documents in order, reading `chunksize` rows at a time."""
+        for first in range(0, len(self), self.chunksize):
+            indptr = self.indptr[first : first + self.chunksize + 1]
+            start, end = indptr[0], indptr[-1]
+            indices = self.indices[start:end].tolist()
+            data = self.data[start:end].tolist()
+            bounds = (indptr - start).tolist()
+            for a, b in zip(bounds[:-1], bounds[1:]):
+                yield list(zip(indices[a:b], data[a:b]))
+
+    def to_csr(self):
+        """Return the corpus as a CSR matrix backed by the loaded arrays."""
+        return csr_matrix(
+            (self.data, self.indices, self.indptr),
+            shape=(len(self), self.meta["num_terms"]),
+            copy=False,
+        )
+
+
+def save_binary_corpus(mat, path):
+    """Save a CSR matrix as a `BinaryCorpus` directory."""
+    os.makedirs(path, exist_ok=True)
+    arrays = {
+        "indptr": mat.indptr.astype(np.int64),
+        "indices": mat.indices.astype(np.int32),
+        "data": mat.data,
+    }
+    for name, arr in arrays.items():
+        arr.tofile(os.path.join(path, f"{name}.bin"))
+    meta = {
+        "num_docs": mat.shape[0],
+        "num_terms": mat.shape[1],
+        "dtypes": {name: arr.dtype.str for name, arr in arrays.items()},
+    }
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def append_binary_corpus(mat, path):
+    """
+    Append the rows of a CSR matrix to a `BinaryCorpus` directory.
+
+    The arrays are appended to the end of the existing files, so the cost
+    only depends on the size of `mat`. The number of columns is updated
+    if `mat` has more (e.g., new tokens were added to the dictionary).
+    Create the corpus if `path` doesn't exist.
+    """
+    if not os.path.exists(os.path.join(path, "meta.json")):
+        return save_binary_corpus(mat, path)
+
+    corpus = BinaryCorpus(path)
+    if mat.data.dtype.str != corpus.meta["dtypes"]["data"]:
+        raise ValueError(
+            f"Data type {mat.data.dtype} doesn't match the corpus "
+            f"({corpus.meta['dtypes']['data']})"
+        )
+
+    # Shift the row offsets of the new rows past the existing values
+    nnz = int(corpus.indptr[-1])
+    arrays = {
+        "indptr": mat.indptr[1:].astype(np.int64) + nnz,
+        "indices": mat.indices.astype(np.int32),
+        "data": mat.data,
+    }
+    for name, arr in arrays.items():
+        with open(os.path.join(path, f"{name}.bin"), "ab") as f:
+            arr.tofile(f)
+
+    meta = corpus.meta
+    meta["num_docs"] += mat.shape[0]
+    meta["num_terms"] = max(meta["num_terms"], mat.shape[1])
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+class ShardedCorpus:
+    """
+    Restartable stream of tokenized docs stored in on-disk shards.
+
+    Each shard is read with `load_shard`, which by default reads token
+    files with exactly one doc per line (see `read_token_file`).
+    """
+
+    def __init__(self, shards, load_shard=read_token_file):
+        """Initialize the ShardedCorpus."""
+        self.shards = shards
+        self.load_shard = load_shard
+
+    def __iter__(self):
+        """Yield the tokenized docs of every shard in order."""
+        return chain.from_iterable(self.load_shard(shard) for shard in self.shards)
+
+
+def _build_shard_dictionary(shard, load_shard=read_token_file):
+    """Build a partial dictionary over a single shard."""
+    return Dictionary(load_shard(shard))
+
+
+def merge_dictionaries(dictionaries, merged=None):
+    """
+    Merge several dictionaries into a single one.
+
+    Uses `Dictionary.merge_with`, which maps the same tokens to the same
+    ids and adds up the document frequencies and document counts. The
+    collection frequencies are added up as well.
+    """
+    merged = Dictionary() if merged is None else merged
+    for dictionary in dictionaries:
+        old2new = merged.merge_with(dictionary).old2new
+        for old_id, count in dictionary.cfs.items():
+            new_id = old2new[old_id]
+            merged.cfs[new_id] = merged.cfs.get(new_id, 0) + count
+    return merged
 
 
 class SparseVec:
-    def __init__(self, docs=None):
+    def __init__(
+        self, docs=None, shards=None, load_shard=read_token_file, n_process=1
+    ):
+        """
+        Build the token-to-id dictionary from tokenized documents.
+
+        Pass either `docs` or `shards`. With `shards`, the instance keeps
+        only a restartable `ShardedCorpus` over them, and the dictionary
+        is built with one partial dictionary per shard, spread over
+        `n_process` worker processes and merged in shard order.
+        """
         if docs is not None:
             self.docs = docs
             self.tk_id_map = Dictionary(self.docs)
+        elif shards is not None:
+            self.docs = ShardedCorpus(shards, load_shard)
+            self.tk_id_map = self.build_dictionary_from_shards(n_process)
+
+    def build_dictionary_from_shards(self, n_process=1):
+        """Build the dictionary over the shards of `self.docs` in parallel."""
+        build_shard = partial(_build_shard_dictionary, load_shard=self.docs.load_shard)
+        if n_process == 1:
+            return merge_dictionaries(map(build_shard, self.docs.shards))
+        with Pool(n_process) as pool:
+            return merge_dictionaries(pool.imap(build_shard, self.docs.shards))
 
     def filter_tokens(self, no_below_n=1, no_above_f=1, keep_n=None):
         """
@@ -42,6 +294,66 @@ class SparseVec:
         bow_vecs = self.build_bow_vectors()
         return [tfidf[vec] for vec in bow_vecs]
 
+    def build_bow_matrix(self, docs=None, dtype=np.int32):
+        """
+        Build a CSR matrix of bag-of-words counts from tokenized documents.
+
+        Rows are documents and columns are token IDs. If `docs` is `None`,
+        use the documents the instance was built with. The matrix can be
+        passed directly to scikit-learn (e.g., `models/cluster.py`) or
+        wrapped with `as_gensim_corpus`.
+        """
+        docs = self.docs if docs is None else docs
+        bow_vecs = (self.tk_id_map.doc2bow(doc) for doc in docs)
+        return bow_to_csr(bow_vecs, len(self.tk_id_map), dtype=dtype)
+
+    def get_idfs(self):
+        """Return the IDF weight of each token ID as an array."""
+        tfidf = TfidfModel(dictionary=self.tk_id_map)
+        idfs = np.zeros(len(self.tk_id_map))
+        idfs[list(tfidf.idfs.keys())] = list(tfidf.idfs.values())
+        return idfs
+
+    def build_tfidf_matrix(self, docs=None, dtype=np.float32):
+        """
+        Build a CSR matrix of TF-IDF weights from tokenized documents.
+
+        The weights are the same as in `build_tfidf_vectors`.
+        """
+        return self.weight_bow_matrix(self.build_bow_matrix(docs), dtype)
+
+    def weight_bow_matrix(self, bow_mat, dtype=np.float32):
+        """
+        Weight a CSR matrix of BoW counts by TF-IDF.
+
+        The IDF weights come from the current document frequencies of the
+        dictionary, so this also works on counts persisted before more
+        documents were added (e.g., `BinaryCorpus(path).to_csr()`).
+        """
+        bow_mat = bow_mat.copy()
+        bow_mat.resize((bow_mat.shape[0], len(self.tk_id_map)))
+        return weight_tfidf(bow_mat, self.get_idfs(), dtype)
+
+    def add_documents(self, new_docs, path=None):
+        """
+        Add tokenized documents without rebuilding the dictionary.
+
+        The dictionary (including the document frequencies) is updated and
+        the new documents are vectorized in a single pass over `new_docs`.
+        Return their BoW counts as a CSR matrix, which is also appended to
+        the binary corpus at `path` if given. IDF weights are only applied
+        when TF-IDF vectors are requested (see `weight_bow_matrix`).
+
+        Note: `filter_tokens` reassigns token IDs, so don't filter the
+        dictionary between updates of a persisted corpus.
+        """
+        bow_vecs = (self.tk_id_map.doc2bow(doc, allow_update=True) for doc in new_docs)
+        bow_mat = bow_to_csr(bow_vecs, num_terms=None, dtype=np.int32)
+        bow_mat.resize((bow_mat.shape[0], len(self.tk_id_map)))
+        if path is not None:
+            append_binary_corpus(bow_mat, path)
+        return bow_mat
+
     def serialize_vectors(self, vecs, path="sparse_vecs.mm"):
         """
         Serialize vectors to a file.
@@ -58,6 +370,22 @@ class SparseVec:
         """
         return MmCorpus(path)
 
+    def serialize_matrix(self, vecs, path="sparse_vecs.csr"):
+        """
+        Serialize vectors to a directory of binary CSR arrays.
+
+        `vecs` can be a CSR matrix or an iterable of sparse vectors. The
+        result can be memory-mapped with `deserialize_matrix`, which is much
+        faster than parsing the Matrix Market format.
+        """
+        if not issparse(vecs):
+            vecs = bow_to_csr(vecs, len(self.tk_id_map), dtype=np.float32)
+        save_binary_corpus(vecs.tocsr(), path)
+
+    def deserialize_matrix(self, path="sparse_vecs.csr", mmap_mode="r"):
+        """Open vectors serialized with `serialize_matrix` as a BinaryCorpus."""
+        return BinaryCorpus(path, mmap_mode=mmap_mode)
+
     def save_dictionary(self, dictionary=None, path="sparse_vecs.dict"):
         """Save the dictionary to a file."""
         dictionary = dictionary or self.tk_id_map
@@ -66,3 +394,109 @@ class SparseVec:
     def load_dictionary(self, path="sparse_vecs.dict"):
         """Load the dictionary from a file."""
         return Dictionary.load(path)
+
+
+def idfs_from_matrix(bow_mat):
+    """
+    Compute IDF weights from the document frequencies of a BoW matrix.
+
+    Uses Gensim's `df2idf` (`log2(N / df)`). Columns without documents get
+    a weight of zero.
+    """
+    dfs = np.bincount(bow_mat.indices, minlength=bow_mat.shape[1])
+    idfs = np.zeros(bow_mat.shape[1])
+    idfs[dfs > 0] = df2idf(dfs[dfs > 0], bow_mat.shape[0])
+    return idfs
+
+
+class HashingVec:
+    """
+    Transform tokenized documents into sparse vectors with the hashing trick.
+
+    Tokens are mapped to one of `num_buckets` columns by a stable hash
+    (CRC32), so there is no dictionary to build or filter: vectorizing is a
+    single pass over the docs, and workers need no shared state. The BoW
+    matrices can be weighted with `build_tfidf_matrix` and saved with
+    `save_binary_corpus` like the ones from `SparseVec`.
+
+    If `keep_tokens` is set, a reverse map from buckets to (at most
+    `max_tokens_per_bucket`) tokens is collected while vectorizing. Use
+    `trim_reverse_map` to keep it only for the top features.
+    """
+
+    def __init__(self, num_buckets=2**20, keep_tokens=False, max_tokens_per_bucket=3):
+        """Initialize the HashingVec class."""
+        self.num_buckets = num_buckets
+        self.keep_tokens = keep_tokens
+        self.max_tokens_per_bucket = max_tokens_per_bucket
+        self.reverse_map = {}
+
+    def token2bucket(self, token):
+        """Return the bucket (column) of a token."""
+        return zlib.crc32(token.encode("utf-8")) % self.num_buckets
+
+    def doc2bow(self, doc):
+        """Convert a tokenized doc to a sorted list of `(bucket, count)`."""
+        return sorted(Counter(map(self.token2bucket, doc)).items())
+
+    def _update_reverse_map(self, reverse_map, docs):
+        """Add the tokens of `docs` to a reverse map with capped buckets."""
+        for doc in docs:
+            for token in doc:
+                tokens = reverse_map.setdefault(self.token2bucket(token), set())
+                if len(tokens) < self.max_tokens_per_bucket:
+                    tokens.add(token)
+
+    def _hash_chunk(self, docs):
+        """Hash a chunk of docs into a BoW matrix and a partial reverse map."""
+        reverse_map = {}
+        if self.keep_tokens:
+            self._update_reverse_map(reverse_map, docs)
+        bow_vecs = (self.doc2bow(doc) for doc in docs)
+        return bow_to_csr(bow_vecs, self.num_buckets, dtype=np.int32), reverse_map
+
+    def build_bow_matrix(self, docs, n_process=1, chunksize=10000):
+        """
+        Build a CSR matrix of bag-of-words counts in a single pass.
+
+        `docs` can be any stream of tokenized docs. With `n_process > 1`,
+        chunks of `chunksize` docs are hashed in worker processes and the
+        resulting rows are stacked in order.
+        """
+        docs = iter(docs)
+        chunks = iter(lambda: list(islice(docs, chunksize)), [])
+        if n_process == 1:
+            results = list(map(self._hash_chunk, chunks))
+        else:
+            with Pool(n_process) as pool:
+                results = list(pool.imap(self._hash_chunk, chunks))
+        if not results:
+            return csr_matrix((0, self.num_buckets), dtype=np.int32)
+
+        for _, reverse_map in results:
+            for bucket, tokens in reverse_map.items():
+                kept = self.reverse_map.setdefault(bucket, set())
+                kept.update(list(tokens)[: self.max_tokens_per_bucket - len(kept)])
+        return vstack([mat for mat, _ in results], format="csr")
+
+    def build_tfidf_matrix(self, bow_mat, dtype=np.float32):
+        """
+        Weight a BoW matrix by TF-IDF.
+
+        The document frequencies are taken from `bow_mat` itself.
+        """
+        return weight_tfidf(bow_mat, idfs_from_matrix(bow_mat), dtype)
+
+    def get_top_features(self, bow_mat, n=1000):
+        """Return the `n` buckets with the highest document frequencies."""
+        dfs = np.bincount(bow_mat.indices, minlength=self.num_buckets)
+        return np.argsort(dfs)[::-1][:n]
+
+    def trim_reverse_map(self, bow_mat, n=1000):
+        """Keep the reverse map only for the top `n` features."""
+        top_features = self.get_top_features(bow_mat, n).tolist()
+        self.reverse_map = {
+            bucket: self.reverse_map[bucket]
+            for bucket in top_features
+            if bucket in self.reverse_map
+        }
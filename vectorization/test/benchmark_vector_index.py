@@ -0,0 +1,58 @@
+"""Benchmark the recall and latency of `IVFIndex` against exact search."""
+
+import time
+
+import numpy as np
+
+from vectorization.semantic_search import EmbeddingMatrix
+from vectorization.vector_index import IVFIndex
+
+
+def make_clustered_vectors(n, dim, n_clusters=1000, seed=0):
+    """Generate vectors around random centers, like document embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim), dtype=np.float32)
+    labels = rng.integers(n_clusters, size=n)
+    noise = rng.standard_normal((n, dim), dtype=np.float32)
+    return centers[labels] + 0.5 * noise
+
+
+def time_per_query(func, queries):
+    """Return the per-query latency of `func` in milliseconds."""
+    start = time.perf_counter()
+    for query in queries:
+        func(query)
+    return (time.perf_counter() - start) / len(queries) * 1e3
+
+
+def recall_at_k(found_ids, true_ids):
+    """Return the share of the true top-k neighbors that were found."""
+    hits = [len(set(f) & set(t)) for f, t in zip(found_ids, true_ids)]
+    return sum(hits) / true_ids.size
+
+
+def manual_benchmark(n=200_000, dim=256, k=10, n_queries=200):
+    """Compare exact search with the IVF index for several `n_probe`."""
+    # Hold out vectors from the same clusters as queries
+    vectors = make_clustered_vectors(n + n_queries, dim)
+    vectors, queries = vectors[:n], vectors[n:]
+
+    exact = EmbeddingMatrix(vectors)
+    true_ids, _ = exact.query(queries, k=k)
+    exact_ms = time_per_query(lambda q: exact.query(q, k=k), queries)
+
+    start = time.perf_counter()
+    index = IVFIndex().build(vectors)
+    print(f"Built index with {index.n_lists} lists in "
+          f"{time.perf_counter() - start:.1f} s")
+    print(f"Exact search: {exact_ms:.2f} ms/query")
+    for n_probe in (1, 4, 16, 64):
+        found_ids, _ = index.search(queries, k=k, n_probe=n_probe)
+        ivf_ms = time_per_query(
+            lambda q: index.search(q, k=k, n_probe=n_probe), queries)
+        print(f"IVF n_probe={n_probe}: {ivf_ms:.2f} ms/query, "
+              f"recall@{k} = {recall_at_k(found_ids, true_ids):.3f}")
+
+
+# Manual benchmark
+manual_benchmark()
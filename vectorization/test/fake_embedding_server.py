@@ -0,0 +1,140 @@
+"""
+Local fake of OpenAI's embeddings endpoint for tests.
+
+The server returns deterministic unit vectors derived from a hash of each
+input, enforces the same input and token limits as the real endpoint, and
+counts the requests it receives. It can also be made slow or flaky with
+`latency` (in seconds) and `error_rate` (the share of requests answered
+with a 429 or 500 error) to test retries and concurrency. Point an
+`OpenAI` client at it with `OpenAI(api_key="fake", base_url=server.base_url)`.
+"""
+
+import base64
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from vectorization.openai_embedding import (
+    MAX_INPUTS_PER_REQUEST,
+    MAX_TOKENS_PER_INPUT,
+    MAX_TOKENS_PER_REQUEST,
+)
+
+
+def fake_embedding(inp, dim=1536):
+    """Return a deterministic unit vector for a string or a token list."""
+    key = inp if isinstance(inp, str) else " ".join(map(str, inp))
+    seed = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(),
+                          "little")
+    vec = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+class FakeEmbeddingServer:
+    """Serve fake embeddings over HTTP from a background thread."""
+
+    def __init__(self, dim=1536, latency=0.0, error_rate=0.0, seed=0,
+                 host="127.0.0.1", port=0):
+        """Initialize the FakeEmbeddingServer."""
+        self.dim = dim
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = np.random.default_rng(seed)
+        self.num_errors = 0
+        self.num_requests = 0
+        self.num_inputs = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.thread = None
+
+    @property
+    def base_url(self):
+        """Return the base URL to pass to the `OpenAI` client."""
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """Start serving in a background thread."""
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server."""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        """Start the server in a `with` block."""
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        """Stop the server at the end of a `with` block."""
+        self.stop()
+
+    def embed(self, body):
+        """Return the response to an embeddings request and its status."""
+        inputs = body["input"]
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        num_tokens = [len(inp.split()) if isinstance(inp, str) else len(inp)
+                      for inp in inputs]
+        if not inputs or len(inputs) > MAX_INPUTS_PER_REQUEST:
+            return 400, {"error": {"message": "Invalid number of inputs."}}
+        if max(num_tokens) > MAX_TOKENS_PER_INPUT:
+            return 400, {"error": {"message": "Input over the token limit."}}
+        if sum(num_tokens) > MAX_TOKENS_PER_REQUEST:
+            return 400, {"error": {"message": "Request over the token limit."}}
+
+        time.sleep(self.latency)
+        with self.lock:
+            if self.rng.random() < self.error_rate:
+                self.num_errors += 1
+                status = int(self.rng.choice([429, 500]))
+                return status, {"error": {"message": "Injected error."}}
+            self.num_requests += 1
+            self.num_inputs += len(inputs)
+
+        data = []
+        for i, inp in enumerate(inputs):
+            vec = fake_embedding(inp, self.dim)
+            if body.get("encoding_format") == "base64":
+                emb = base64.b64encode(vec.tobytes()).decode()
+            else:
+                emb = vec.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": emb})
+        usage = {"prompt_tokens": sum(num_tokens),
+                 "total_tokens": sum(num_tokens)}
+        return 200, {"object": "list", "data": data,
+                     "model": body["model"], "usage": usage}
+
+    def _make_handler(self):
+        """Build the request handler class bound to this server."""
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep connections alive between requests, like the real API
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                if not self.path.endswith("/embeddings"):
+                    self.send_error(404)
+                    return
+                length = int(self.headers["Content-Length"])
+                status, response = server.embed(json.loads(self.rfile.read(length)))
+                payload = json.dumps(response).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
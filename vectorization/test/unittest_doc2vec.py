@@ -0,0 +1,63 @@
+"""Test resuming Doc2Vec training from checkpoints."""
+
+import os
+import random
+import tempfile
+import unittest
+
+from gensim.models.callbacks import CallbackAny2Vec
+from vectorization.doc2vec import (
+    EpochCheckpoint,
+    resume_doc2vec_training,
+    train_doc2vec_model,
+)
+
+random.seed(0)
+VOCAB = [f"w{i}" for i in range(200)]
+DOCS = [random.choices(VOCAB, k=30) for _ in range(200)]
+
+
+class Crash(CallbackAny2Vec):
+    """Raise an error after a number of epochs."""
+
+    def __init__(self, after):
+        self.after = after
+        self.epochs = 0
+
+    def on_epoch_end(self, model):
+        self.epochs += 1
+        if self.epochs == self.after:
+            raise RuntimeError("Crash")
+
+
+class TestResumeDoc2Vec(unittest.TestCase):
+    """Use unittest to test crashing and resuming training twice."""
+
+    def test_resume_twice(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            prefix = os.path.join(tmp_dir, "ckpt")
+            with self.assertRaises(RuntimeError):
+                train_doc2vec_model(DOCS, vector_size=10, epochs=10, alpha=0.05,
+                                    min_alpha=0.001, workers=1,
+                                    callbacks=[EpochCheckpoint(prefix), Crash(4)])
+
+            # The first resume crashes after 3 more epochs
+            with self.assertRaises(RuntimeError):
+                resume_doc2vec_training(
+                    prefix, DOCS,
+                    callbacks=[EpochCheckpoint(prefix, start_epoch=4), Crash(3)])
+
+            crash = Crash(None)
+            model, epochs_done = resume_doc2vec_training(
+                prefix, DOCS,
+                callbacks=[EpochCheckpoint(prefix, start_epoch=7), crash])
+
+        self.assertEqual(epochs_done, 7)
+        self.assertEqual(crash.epochs, 3)
+        self.assertEqual(model.epochs, 10)
+        self.assertEqual(model.alpha, 0.05)
+        self.assertEqual(model.min_alpha, 0.001)
+
+
+if __name__ == "__main__":
+    unittest.main()
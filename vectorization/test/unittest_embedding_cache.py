@@ -0,0 +1,40 @@
+"""Test the on-disk embedding cache."""
+
+import tempfile
+import unittest
+
+import numpy as np
+from vectorization.embedding_cache import EmbeddingCache
+
+
+def constant_embedder(value):
+    """Return an `embed_func` that embeds every text as `value`."""
+    return lambda texts: np.full((len(texts), 4), value, dtype=np.float32)
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    """Use unittest to test the embedding cache."""
+
+    def test_interleaved_writers(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            writer_a = EmbeddingCache(cache_dir, dim=4)
+            writer_b = EmbeddingCache(cache_dir)
+            writer_a.embed(["x"], "model", constant_embedder(1))
+            writer_b.embed(["y"], "model", constant_embedder(2))
+            writer_a.embed(["z"], "model", constant_embedder(3))
+
+            for cache in (writer_a, EmbeddingCache(cache_dir)):
+                embs, found = cache.get(["x", "y", "z"], "model")
+                self.assertTrue(found.all())
+                np.testing.assert_array_equal(embs[:, 0], [1, 2, 3])
+
+    def test_settings_in_key(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = EmbeddingCache(cache_dir)
+            cache.embed(["x"], "model", constant_embedder(1), long_inputs="truncate")
+            _, found = cache.get(["x"], "model", long_inputs="split")
+            self.assertFalse(found.any())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+"""Test the batched OpenAI embedding routines against a fake server."""
+
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from openai import AsyncOpenAI, OpenAI
+from vectorization.async_embedding import (
+    embed_texts_async,
+    embed_texts_concurrently,
+)
+from vectorization.embedding_cache import EmbeddingCache
+from vectorization.openai_embedding import (
+    create_embeddings_openai,
+    get_encoder,
+)
+from vectorization.test.fake_embedding_server import (
+    FakeEmbeddingServer,
+    fake_embedding,
+)
+
+
+class TestCreateEmbeddings(unittest.TestCase):
+    """Use unittest to test batched embedding requests."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeEmbeddingServer(dim=8).start()
+        cls.client = OpenAI(api_key="fake", base_url=cls.server.base_url)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.num_requests = 0
+
+    def test_input_order_and_batching(self):
+        texts = [f"abstract number {i}" for i in range(5000)]
+        embs = create_embeddings_openai(texts, openai_client=self.client)
+        enc = get_encoder()
+        expected = np.array([fake_embedding(enc.encode_ordinary(text), 8)
+                             for text in texts])
+        self.assertEqual(embs.dtype, np.float32)
+        np.testing.assert_array_equal(embs, expected)
+        self.assertEqual(self.server.num_requests, 3)
+
+    def test_request_token_limit(self):
+        texts = ["word " * 5000] * 10
+        create_embeddings_openai(texts, openai_client=self.client)
+        self.assertEqual(self.server.num_requests, 1)
+        create_embeddings_openai(texts, max_request_tokens=19000,
+                                 openai_client=self.client)
+        self.assertEqual(self.server.num_requests, 1 + 4)
+
+    def test_special_token_strings(self):
+        texts = ["an abstract ending with <|endoftext|>", "<|fim_prefix|>"]
+        embs = create_embeddings_openai(texts, openai_client=self.client)
+        expected = [fake_embedding(get_encoder().encode_ordinary(text), 8)
+                    for text in texts]
+        np.testing.assert_array_equal(embs, expected)
+
+    def test_long_inputs(self):
+        text = "word " * 10000
+        tokens = get_encoder().encode_ordinary(text)
+        truncated = create_embeddings_openai([text], openai_client=self.client)
+        np.testing.assert_array_equal(truncated[0],
+                                      fake_embedding(tokens[:8191], 8))
+
+        split = create_embeddings_openai([text], long_inputs="split",
+                                         openai_client=self.client)
+        expected = (fake_embedding(tokens[:8191], 8) * 8191
+                    + fake_embedding(tokens[8191:], 8) * (len(tokens) - 8191))
+        np.testing.assert_allclose(split[0], expected / np.linalg.norm(expected),
+                                   rtol=1e-5)
+
+    def test_cache(self):
+        texts = [f"cached abstract {i}" for i in range(100)]
+        expected = create_embeddings_openai(texts, openai_client=self.client)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = EmbeddingCache(cache_dir)
+            create_embeddings_openai(texts[:60], openai_client=self.client,
+                                     cache=cache)
+            self.server.num_inputs = 0
+            embs = create_embeddings_openai(texts, openai_client=self.client,
+                                            cache=EmbeddingCache(cache_dir))
+        np.testing.assert_array_equal(embs, expected)
+        self.assertEqual(self.server.num_inputs, 40)
+
+
+class TestEmbedTextsConcurrently(unittest.TestCase):
+    """Use unittest to test concurrent embedding against a flaky server."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = FakeEmbeddingServer(dim=8, latency=0.05,
+                                         error_rate=0.3).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.server.num_requests = 0
+        # Point the clients opened by `embed_texts_async` at the server
+        env = {"OPENAI_KEY": "fake", "OPENAI_BASE_URL": self.server.base_url}
+        patcher = mock.patch.dict(os.environ, env)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def expected_embeddings(self, texts):
+        enc = get_encoder()
+        return np.array([fake_embedding(enc.encode_ordinary(text), 8)
+                         for text in texts])
+
+    def test_retries_and_order(self):
+        texts = [f"abstract number {i}" for i in range(2000)]
+        embs = embed_texts_concurrently(texts, max_inputs=100, base_delay=0.01)
+        np.testing.assert_array_equal(embs, self.expected_embeddings(texts))
+        self.assertEqual(self.server.num_requests, 20)
+
+    def test_given_client(self):
+        texts = [f"abstract with a client {i}" for i in range(300)]
+
+        async def embed_with_client():
+            async with AsyncOpenAI(api_key="fake", base_url=self.server.base_url,
+                                   max_retries=0) as client:
+                return await embed_texts_async(texts, max_inputs=100,
+                                               base_delay=0.01,
+                                               openai_client=client)
+
+        embs = asyncio.run(embed_with_client())
+        np.testing.assert_array_equal(embs, self.expected_embeddings(texts))
+
+    def test_resume_from_cache(self):
+        texts = [f"resumed abstract {i}" for i in range(500)]
+        with tempfile.TemporaryDirectory() as cache_dir:
+            first = embed_texts_concurrently(texts[:300], max_inputs=100,
+                                             base_delay=0.01,
+                                             cache=EmbeddingCache(cache_dir))
+            self.server.num_inputs = 0
+            embs = embed_texts_concurrently(texts, max_inputs=100,
+                                            base_delay=0.01,
+                                            cache=EmbeddingCache(cache_dir))
+        np.testing.assert_array_equal(embs[:300], first)
+        self.assertEqual(self.server.num_inputs, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
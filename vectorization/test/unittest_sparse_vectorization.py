@@ -0,0 +1,95 @@
+"""Test building SparseVec dictionaries and matrices from shards."""
+
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.sparse import vstack
+
+from helper_funcs.files import read_token_file, write_token_file
+from vectorization.sparse_vectorization import (
+    BinaryCorpus,
+    SparseVec,
+    save_binary_corpus,
+)
+
+# Empty docs and docs longer than Gensim's 10,000-token line limit
+DOCS = [["x", "y"], [], ["x"] * 12000, ["y", "z", "z"], [], ["x"] * 12000]
+
+
+class TestShardedSparseVec(unittest.TestCase):
+    """Use unittest to compare sharded and in-memory SparseVec."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.TemporaryDirectory()
+        cls.shards = [
+            write_token_file(DOCS[:3], os.path.join(cls.tmp_dir.name, "0.txt")),
+            write_token_file(DOCS[3:], os.path.join(cls.tmp_dir.name, "1.txt.gz")),
+        ]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp_dir.cleanup()
+
+    def test_read_token_file(self):
+        docs = [doc for shard in self.shards for doc in read_token_file(shard)]
+        self.assertEqual(docs, DOCS)
+
+    def test_sharded_matches_in_memory(self):
+        in_memory = SparseVec(DOCS)
+        sharded = SparseVec(shards=self.shards)
+        token2id = in_memory.tk_id_map.token2id
+        sharded_token2id = sharded.tk_id_map.token2id
+        self.assertEqual(sharded.tk_id_map.num_docs, in_memory.tk_id_map.num_docs)
+        for token in token2id:
+            self.assertEqual(
+                sharded.tk_id_map.dfs[sharded_token2id[token]],
+                in_memory.tk_id_map.dfs[token2id[token]],
+            )
+        self.assertEqual(sharded.build_bow_matrix().shape[0], len(DOCS))
+
+
+
+class TestAddDocuments(unittest.TestCase):
+    """Use unittest to compare incremental updates with a full rebuild."""
+
+    def test_matches_full_rebuild(self):
+        # The updates bring new tokens and repeat existing ones
+        batches = [DOCS[:2], DOCS[2:4], [["z", "w", "w"], ["v"], []], DOCS[4:]]
+        all_docs = [doc for batch in batches for doc in batch]
+        full = SparseVec(all_docs)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "corpus")
+            incremental = SparseVec(batches[0])
+            bow_mats = [incremental.build_bow_matrix()]
+            save_binary_corpus(bow_mats[0], path)
+            for batch in batches[1:]:
+                bow_mats.append(incremental.add_documents(batch, path=path))
+            persisted = BinaryCorpus(path, mmap_mode=None).to_csr()
+
+        dictionary = incremental.tk_id_map
+        self.assertEqual(dictionary.token2id, full.tk_id_map.token2id)
+        self.assertEqual(dictionary.dfs, full.tk_id_map.dfs)
+        self.assertEqual(dictionary.cfs, full.tk_id_map.cfs)
+        self.assertEqual(dictionary.num_docs, full.tk_id_map.num_docs)
+        self.assertEqual(dictionary.num_pos, full.tk_id_map.num_pos)
+
+        full_bow = full.build_bow_matrix()
+        for bow_mat in bow_mats:
+            bow_mat.resize((bow_mat.shape[0], len(dictionary)))
+        self.assertEqual((vstack(bow_mats) != full_bow).nnz, 0)
+        self.assertEqual(persisted.shape, full_bow.shape)
+        self.assertEqual((persisted != full_bow).nnz, 0)
+
+        np.testing.assert_allclose(
+            incremental.weight_bow_matrix(persisted).toarray(),
+            full.build_tfidf_matrix().toarray(),
+            rtol=1e-6,
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+"""Approximate nearest-neighbor search over document vectors."""
+
+import json
+import os
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+
+from vectorization.semantic_search import normalize_rows, top_k
+
+
+class IVFIndex:
+    """
+    Inverted file (IVF) index for approximate nearest-neighbor search.
+
+    The vectors are clustered with k-means into `n_lists` lists, and
+    stored sorted by list so that each list is a contiguous block. A query
+    only scans the `n_probe` lists whose centroids are closest to it:
+    raising `n_probe` improves recall at the cost of latency, up to an
+    exact search with `n_probe=n_lists`.
+
+    Works with any float matrix, e.g., OpenAI embeddings, Doc2Vec vectors
+    (`model.dv.vectors` with ids `model.dv.index_to_key`) or topic
+    distributions. With `metric="cosine"`, results are sorted by
+    decreasing cosine similarity; with `metric="l2"`, by increasing
+    Euclidean distance.
+    """
+
+    def __init__(self, n_lists=None, metric="cosine", seed=42):
+        """Initialize the IVFIndex."""
+        if metric not in ("cosine", "l2"):
+            raise ValueError('`metric` should be "cosine" or "l2".')
+        self.n_lists = n_lists
+        self.metric = metric
+        self.seed = seed
+        self.centroids = None
+        self.offsets = None
+        self.vectors = None
+        self.ids = None
+        self.sq_norms = None
+
+    def _prepare(self, vecs):
+        """Convert vectors to float32, normalizing them for cosine."""
+        if self.metric == "cosine":
+            return normalize_rows(vecs)
+        return np.array(vecs, dtype=np.float32, order="C", ndmin=2)
+
+    def _scores(self, queries, vecs, sq_norms):
+        """Return scores where higher is closer (`2 x.q - |x|^2` for l2)."""
+        scores = queries @ vecs.T
+        if self.metric == "l2":
+            scores = 2 * scores - sq_norms
+        return scores
+
+    def _assign(self, vecs, chunksize=100_000):
+        """Return the list of each vector."""
+        centroid_sq_norms = (self.centroids**2).sum(axis=1)
+        return np.concatenate(
+            [
+                self._scores(
+                    vecs[start : start + chunksize], self.centroids, centroid_sq_norms
+                ).argmax(axis=1)
+                for start in range(0, len(vecs), chunksize)
+            ]
+        )
+
+    def build(self, vectors, ids=None, sample_size=100_000):
+        """
+        Build the index over the rows of `vectors`.
+
+        The centroids are trained on a random sample of `sample_size`
+        vectors. By default, `n_lists` is about `4 * sqrt(n)`.
+        """
+        vecs = self._prepare(vectors)
+        ids = np.arange(len(vecs)) if ids is None else np.asarray(ids)
+        if self.n_lists is None:
+            self.n_lists = max(1, int(4 * np.sqrt(len(vecs))))
+        self.n_lists = min(self.n_lists, len(vecs))
+
+        # Train the centroids on a sample
+        rng = np.random.default_rng(self.seed)
+        sample = vecs[rng.permutation(len(vecs))[:sample_size]]
+        kmeans = MiniBatchKMeans(
+            n_clusters=self.n_lists, n_init=3, random_state=self.seed
+        )
+        kmeans.fit(sample)
+        self.centroids = kmeans.cluster_centers_.astype(np.float32)
+        if self.metric == "cosine":
+            self.centroids = normalize_rows(self.centroids)
+
+        # Store the vectors sorted by list
+        lists = self._assign(vecs)
+        order = np.argsort(lists, kind="stable")
+        self.vectors = vecs[order]
+        self.ids = ids[order]
+        self.offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(lists, minlength=self.n_lists))]
+        )
+        self.sq_norms = (self.vectors**2).sum(axis=1)
+        return self
+
+    def __len__(self):
+        """Return the number of indexed vectors."""
+        return len(self.vectors)
+
+    def search(self, query_vecs, k=10, n_probe=8):
+        """
+        Return the ids and scores of the approximate top-k neighbors.
+
+        `query_vecs` is a single vector or a matrix with one query per row;
+        results have the same layout as `EmbeddingMatrix.query`. Scores are
+        cosine similarities or Euclidean distances, depending on the metric.
+        If the probed lists hold fewer than `k` vectors, the missing results
+        have a score of -inf (cosine) or inf (l2).
+        """
+        queries = self._prepare(query_vecs)
+        n_probe = min(n_probe, self.n_lists)
+        centroid_sq_norms = (self.centroids**2).sum(axis=1)
+        centroid_scores = self._scores(queries, self.centroids, centroid_sq_norms)
+        probes = top_k(centroid_scores, n_probe)
+
+        k = min(k, len(self))
+        rows = np.zeros((len(queries), k), dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for i, query in enumerate(queries):
+            bounds = [(self.offsets[j], self.offsets[j + 1]) for j in probes[i]]
+            cand_rows = np.concatenate([np.arange(a, b) for a, b in bounds])
+            cand_scores = np.concatenate(
+                [
+                    self._scores(query, self.vectors[a:b], self.sq_norms[a:b])
+                    for a, b in bounds
+                ]
+            )
+            top = top_k(cand_scores, k)
+            rows[i, : len(top)] = cand_rows[top]
+            scores[i, : len(top)] = cand_scores[top]
+
+        if self.metric == "l2":
+            sq_dists = (queries**2).sum(axis=1, keepdims=True) - scores
+            scores = np.sqrt(np.maximum(sq_dists, 0))
+        if np.ndim(query_vecs) == 1:
+            return self.ids[rows[0]], scores[0]
+        return self.ids[rows], scores
+
+    def save(self, path):
+        """Save the index as `.npy` arrays in the directory `path`."""
+        os.makedirs(path, exist_ok=True)
+        for name in ("centroids", "offsets", "vectors", "ids", "sq_norms"):
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        meta = {"n_lists": self.n_lists, "metric": self.metric, "seed": self.seed}
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode="r"):
+        """Load a saved index, memory-mapping the vectors by default."""
+        with open(os.path.join(path, "meta.json")) as f:
+            index = cls(**json.load(f))
+        for name in ("centroids", "offsets", "vectors", "ids", "sq_norms"):
+            file_path = os.path.join(path, f"{name}.npy")
+            mode = mmap_mode if name in ("vectors", "sq_norms") else None
+            arr = np.load(file_path, mmap_mode=mode, allow_pickle=True)
+            setattr(index, name, arr)
+        return index